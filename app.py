@@ -1,493 +1,244 @@
-import re
-from urllib.parse import urlparse, parse_qs
-import requests
-import time
-import random
-import datetime
-import math
-import os
-from openpyxl import Workbook
-from openpyxl.styles import PatternFill, Font, Alignment, Border, Side, NamedStyle
-import json
-from flask import Flask, request, Response, render_template
+import hashlib
+from flask import Flask, request, Response, render_template, send_from_directory
+from card_fetcher import card_flights, catalog_queues
+from http_client import connection_stats
+from json_backend import dumps
+from rate_control import get_rate_control
+from batch import BatchTarget
+from pipeline import stream_parser, batch_parser, parse_target
+from templates import start_preload
+from categories import get_category_index, paginate
+from jobs import JobManager, ACTIVE
+from progress import client_interval, coalesce_progress
+from metrics import REGISTRY, ACTIVE_STREAMS, snapshot_gauge, snapshot_counter
+
+# Шаблоны категорий разбираются в фоне, пока приложение принимает запросы
+start_preload()
 
-# Заголовки, маскирующиеся под реальный браузер
-headers = {
-    'Accept': '*/*',
-    'Accept-Language': 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7',
-    'Connection': 'keep-alive',
-    'Origin': 'https://www.wildberries.ru',
-    'Referer': 'https://www.wildberries.ru/',
-    'Sec-Ch-Ua': '"Not A(Brand";v="99", "Google Chrome";v="121", "Chromium";v="121"',
-    'Sec-Ch-Ua-Mobile': '?0',
-    'Sec-Ch-Ua-Platform': '"Windows"',
-    'Sec-Fetch-Dest': 'empty',
-    'Sec-Fetch-Mode': 'cors',
-    'Sec-Fetch-Site': 'cross-site',
-    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
-}
+app = Flask(__name__, template_folder='public')
 
-def make_request(url, headers, timeout=10, retries=5, backoff_factor=2):
-    """Надежная функция для выполнения HTTP-запросов с повторными попытками."""
-    for i in range(retries):
-        try:
-            response = requests.get(url, headers=headers, timeout=timeout)
-            response.raise_for_status()  # Вызовет исключение для кодов 4xx/5xx
-            return response
-        except requests.exceptions.HTTPError as e:
-            if e.response.status_code == 429:
-                # Используем линейную задержку с небольшим случайным элементом
-                sleep_time = backoff_factor * (i + 1) + random.uniform(0, 1)
-                time.sleep(sleep_time)
-                continue
-            else:
-                # Для других ошибок HTTP, можно просто прекратить попытки
-                raise e
-        except requests.exceptions.RequestException as e:
-            # Для сетевых ошибок (timeout, connection error) также попробуем еще раз
-            sleep_time = backoff_factor * (i + 1) + random.uniform(0, 1)
-            time.sleep(sleep_time)
-            continue
-    # Если все попытки не увенчались успехом
-    raise Exception(f"Не удалось получить данные после {retries} попыток. URL: {url}")
+@app.route('/')
+def index():
+    return render_template('index.html')
 
+def json_response(data, status=200):
+    return Response(dumps(data), status=status, mimetype='application/json')
 
-# --- НОВАЯ ФУНКЦИЯ-ГЕНЕРАТОР ДЛЯ СТРИМИНГА ПРОГРЕССA ---
-def stream_parser(seller_id, brand_id, xsubject_id=None):
+def cached_json_response(data, version):
     """
-    Основная логика парсинга, перестроенная в генератор, который yield'ит обновления прогресса.
+    Ответ справочника с ETag: версия subcategories.json плюс параметры запроса.
+    Клиент с совпадающим If-None-Match получает 304 без тела.
     """
-    all_products = []
-    # 1. Получение карты маршрутов для корзин
-    yield json.dumps({'type': 'log', 'message': 'Получение карты маршрутов WB...'})
-    baskets = get_mediabasket_route_map()
-    if not baskets:
-        yield json.dumps({'type': 'log', 'message': 'Не удалось получить карту маршрутов. Парсинг может быть неполным.'})
-
-    # 2. Определение общего количества товаров
-    url_total_list = f"https://catalog.wb.ru/sellers/v8/filters?ab_testing=false&appType=1&curr=rub&dest=12358357&fbrand={brand_id}&lang=ru&spp=30&supplier={seller_id}&uclusters=0"
-    if xsubject_id:
-        url_total_list += f"&xsubject={xsubject_id}"
+    response = json_response(data)
+    query = '&'.join(f"{key}={value}" for key, value in sorted(request.args.items()))
+    response.set_etag(f"{version}-{hashlib.sha1(query.encode('utf-8')).hexdigest()[:8]}")
+    response.headers['Cache-Control'] = 'public, max-age=300'
+    return response.make_conditional(request)
 
+def int_arg(name, default=None):
     try:
-        response_total = make_request(url_total_list, headers=headers)
-        res_total = response_total.json()
-        products_total = res_total.get('data', {}).get('total', 0)
-    except (requests.exceptions.RequestException, json.JSONDecodeError, Exception) as e:
-        raise Exception(f"Критическая ошибка при получении общего числа товаров: {e}")
-
-    if not products_total:
-        raise Exception("Товары не найдены. Проверьте правильность ID продавца и бренда.")
-
-    pages_count = math.ceil(products_total / 100)
-    yield json.dumps({'type': 'start', 'total': products_total, 'message': f'Найдено товаров: {products_total}. Начинаем обработку...'})
-
-    # 3. Постраничный обход и сбор данных
-    current_page, count = 1, 0
-    while current_page <= pages_count:
-        url_list = f"https://catalog.wb.ru/sellers/v4/catalog?ab_testing=false&appType=1&curr=rub&dest=12358357&fbrand={brand_id}&hide_dtype=13&lang=ru&page={current_page}&sort=popular&spp=30&supplier={seller_id}"
-        if xsubject_id:
-            url_list += f"&xsubject={xsubject_id}"
-
-        try:
-            response = make_request(url_list, headers=headers)
-            products_on_page = response.json().get('products', [])
-        except (requests.exceptions.RequestException, json.JSONDecodeError):
-            current_page += 1
-            time.sleep(random.uniform(5, 7)) # Увеличенная задержка при ошибке на странице
-            continue
-
-        for item in products_on_page:
-            count += 1
-            yield json.dumps({'type': 'progress', 'current': count, 'total': products_total, 'message': item.get('name', '')})
-            
-            productId = str(item['id'])
-            backetName = get_host_by_range(int(productId[:-5]), baskets)
-            backetNumber, isAutoServer = 1, bool(backetName)
-            
-            # --- Улучшенный механизм получения деталей о товаре ---
-            product_retries = 3
-            product_backoff_factor = 3
-            for i in range(product_retries):
-                if not isAutoServer and backetNumber > 12:
-                    item['advanced'] = {}
-                    break # Прерываем, если перебрали все корзины
-
-                backetFormattedNumber = f"0{backetNumber}" if backetNumber < 10 else str(backetNumber)
-                urlItem = f"https://{backetName if isAutoServer else f'basket-{backetFormattedNumber}.wbbasket.ru'}/vol{productId[:-5]}/part{productId[:-3]}/{productId}/info/ru/card.json"
-                
-                try:
-                    productResponse = requests.get(urlItem, headers=headers, timeout=5)
-                    if productResponse.status_code == 200:
-                        item['advanced'] = productResponse.json()
-                        break # Успех, выходим из цикла попыток
-                    
-                    if not isAutoServer and productResponse.status_code == 404:
-                        backetNumber += 1
-                        continue # Пробуем следующую корзину
-
-                    if productResponse.status_code == 429:
-                        # Линейная задержка при ошибке 429
-                        time.sleep(product_backoff_factor * (i + 1) + random.uniform(0, 1))
-                        continue
-                    
-                    # Для всех других ошибок выходим и не сохраняем данные
-                    item['advanced'] = {}
-                    break
-
-                except requests.exceptions.RequestException:
-                     # Линейная задержка при ошибках соединения
-                    time.sleep(product_backoff_factor * (i + 1) + random.uniform(0, 1))
-                    continue
-            
-            all_products.append(item)
-            time.sleep(random.uniform(1.5, 2.5)) # Увеличенная задержка между товарами
-
-        current_page += 1
-        time.sleep(random.uniform(4, 6)) # Увеличенная задержка между страницами
-
-    # 4. Маппинг данных и создание файла
-    yield json.dumps({'type': 'log', 'message': 'Формирование итоговой таблицы...'})
-    mapped_data = map_data(all_products, baskets) # Передаем baskets в map_data
+        return int(request.args.get(name))
+    except (TypeError, ValueError):
+        return default
 
-    yield json.dumps({'type': 'log', 'message': 'Создание Excel-файла...'})
-    output_path = create_excel_file(mapped_data)
-    if not output_path:
-        raise Exception("Не удалось создать Excel-файл.")
-
-    download_filename = os.path.basename(output_path)
-
-    # 5. Отправка финального результата
-    yield json.dumps({
-        'type': 'result',
-        'data': {
-            'table_data': mapped_data,
-            'download_filename': download_filename
-        }
-    })
-
-
-# --- Вспомогательные функции (без критических изменений) ---
-def check_string(s): return bool(re.fullmatch(r'(\d+%3B)*\d+', s))
-def parse_input(input_str):
-    parts = input_str.split()
-    sellerId, brandId, xsubjectId = '', '', None
-
-    if len(parts) >= 2:
-        sellerId, brandId = parts[0], parts[1]
-        if not sellerId.isdigit() or not check_string(brandId):
-            raise ValueError("Необходимо указать число и ID бренда(ов)")
-        if len(parts) > 2 and parts[2].isdigit():
-            xsubjectId = parts[2]
+@app.route('/categories')
+def categories():
+    """
+    Поиск по справочнику: без category — список категорий, с category — ее предметы.
+    Параметры: q (поиск по началу слов), offset, limit.
+    """
+    index = get_category_index()
+    category = request.args.get('category')
+    query = request.args.get('q', '')
+    if category:
+        items = index.find_subcategories(category, query)
+        if items is None:
+            return json_response({'error': 'Unknown category'}, 404)
     else:
-        parseResult = urlparse(input_str)
-        sellerId = str(parseResult.path).split('/')[2]
-        query = parse_qs(parseResult.query)
-        
-        if 'fbrand' not in query:
-            raise ValueError("Параметр fbrand не найден в ссылке.")
-        brandId = query['fbrand'][0]
-
-        if 'xsubject' in query and query['xsubject'][0].isdigit():
-            xsubjectId = query['xsubject'][0]
-
-    return (sellerId, brandId, xsubjectId)
-
-def get_mediabasket_route_map():
-    try:
-        response = make_request('https://cdn.wbbasket.ru/api/v3/upstreams', headers=headers, timeout=5)
-        data = response.json()
-        if 'recommend' in data and 'mediabasket_route_map' in data['recommend']:
-            return data['recommend']['mediabasket_route_map'][0]['hosts']
-    except (requests.exceptions.RequestException, json.JSONDecodeError, KeyError):
-        return []
-    return []
-
-def get_host_by_range(range_value, route_map):
-    if not isinstance(route_map, list): return ''
-    for host_info in route_map: 
-        if 'vol_range_from' in host_info and 'vol_range_to' in host_info and host_info['vol_range_from'] <= range_value <= host_info['vol_range_to']: 
-            return host_info['host']
-    return ''
-
-def map_data(data, baskets):
-    new_data = []
-    for item in data:
-        advanced = item.get('advanced')
-        if not advanced: continue
-        
-        options = advanced.get('options', [])
-        grouped_options = advanced.get('grouped_options', [])
-        
-        dimensions_group = find_options_by_group_name(grouped_options, 'Габариты')
-        advanced_info_group = find_options_by_group_name(grouped_options, 'Дополнительная информация')
-        cosmetics_group = find_options_by_group_name(grouped_options, 'Косметическое средство')
-
-        certificates = advanced.get('certificates', [])
-        cert_end_date, cert_reg_date, declaration_num, certificate_num, sgr_num = '', '', '', '', ''
-        if certificates:
-            cert = certificates[0]
-            cert_end_date = cert.get('end_date','')
-            cert_reg_date = cert.get('start_date','')
-            if 'ЕАЭС' in cert.get('__name', ''):
-                declaration_num = cert.get('number', '')
-            else:
-                certificate_num = cert.get('number', '')
-
-        new_item = {
-            'Группа': '', 
-            'Артикул продавца': item.get('vendorCode', ''),
-            'Артикул WB': '',  # Оставляем пустым
-            'Наименование': item.get('name', ''),
-            'Категория продавца': advanced.get('subj_root_name', ''), 
-            'Бренд': item.get('brand', ''),
-            'Описание': advanced.get('description', ''),
-            'Фото': '',  # Оставляем пустым
-            'Видео': '',  # Оставляем пустым
-            'Полное наименование товара': advanced.get('name', ''),
-            'Состав': find_value_in_arrays(options, advanced_info_group, search_name='Состав'),
-            'Баркод': '', 
-            'Вес с упаковкой (кг)': extract_number(find_value_in_arrays(options, dimensions_group, search_name='Вес с упаковкой (кг)')),
-            'Вес товара без упаковки (г)': extract_number(find_value_in_arrays(options, dimensions_group, search_name='Вес товара без упаковки (г)')),
-            'Высота упаковки': extract_number(find_value_in_arrays(options, dimensions_group, search_name='Высота упаковки')),
-            'Длина упаковки': extract_number(find_value_in_arrays(options, dimensions_group, search_name='Длина упаковки')),
-            'Ширина упаковки': extract_number(find_value_in_arrays(options, dimensions_group, search_name='Ширина упаковки')),
-            'Дата окончания действия сертификата/декларации': cert_end_date,
-            'Дата регистрации сертификата/декларации': cert_reg_date,
-            'Номер декларации соответствия': declaration_num,
-            'Номер сертификата соответствия': certificate_num,
-            'Свидетельство о регистрации СГР': sgr_num,
-            'SPF': find_value_in_arrays(options, cosmetics_group, search_name='SPF'),
-            'Артикул OZON': '', 
-            'Возрастные ограничения': find_value_in_arrays(options, advanced_info_group, search_name='Возрастные ограничения'),
-            'Время нанесения': find_value_in_arrays(options, cosmetics_group, search_name='Время нанесения'),
-            'Действие': find_value_in_arrays(options, cosmetics_group, search_name='Действие'),
-            'ИКПУ': '', 
-            'Код упаковки': '', 
-            'Комплектация': find_value_in_arrays(options, advanced_info_group, search_name='Комплектация'),
-            'Назначение косметического средства': find_value_in_arrays(options, advanced_info_group, search_name='Назначение косметического средства'),
-            'Назначение подарка': '', 
-            'Объем товара': extract_number(find_value_in_arrays(options, cosmetics_group, search_name='Объем товара')),
-            'Повод': '', 
-            'Раздел меню': '', 
-            'Срок годности': find_value_in_arrays(options, advanced_info_group, search_name='Срок годности'),
-            'Страна производства': find_value_in_arrays(options, advanced_info_group, search_name='Страна производства'),
-            'ТНВЭД': find_value_in_arrays(options, advanced_info_group, search_name='ТН ВЭД'),
-            'Тип доставки': '', 
-            'Тип кожи': find_value_in_arrays(options, cosmetics_group, search_name='Тип кожи'),
-            'Упаковка': find_value_in_arrays(options, advanced_info_group, search_name='Упаковка'),
-            'Форма упаковки': '', 
-            'Ставка НДС': '20'
-        }
-        new_data.append(new_item)
-    return new_data
-
-def create_excel_file(data):
-    if not data:
-        return None
-
-    if not os.path.exists("downloads"):
-        os.makedirs("downloads")
-    
-    filename = f"result_{datetime.datetime.now():%Y-%m-%d_%H-%M-%S}.xlsx"
-    output_path = os.path.join("downloads", filename)
-    
-    wb = Workbook()
-    ws = wb.active
-
-    # Стили
-    header_style_s0 = NamedStyle(name="header_style_s0")
-    header_style_s0.fill = PatternFill(start_color="ECDAFF", end_color="ECDAFF", fill_type="solid")
-    header_style_s0.font = Font(name='Calibri', size=16)
-    header_style_s0.alignment = Alignment(vertical='bottom')
-
-    header_style_s1 = NamedStyle(name="header_style_s1")
-    header_style_s1.fill = PatternFill(start_color="ECDAFF", end_color="ECDAFF", fill_type="solid")
-    header_style_s1.font = Font(name='Calibri', size=12)
-    header_style_s1.alignment = Alignment(vertical='bottom')
-
-    header_style_s2 = NamedStyle(name="header_style_s2")
-    header_style_s2.fill = PatternFill(start_color="9A41FE", end_color="9A41FE", fill_type="solid")
-    header_style_s2.font = Font(name='Calibri', size=12, bold=True, color="FFFFFF")
-    header_style_s2.alignment = Alignment(vertical='center')
-
-    description_style_s3 = NamedStyle(name="description_style_s3")
-    description_style_s3.fill = PatternFill(start_color="F0F0F3", end_color="F0F0F3", fill_type="solid")
-    description_style_s3.font = Font(name='Calibri', size=10)
-    description_style_s3.alignment = Alignment(vertical='top', wrap_text=True)
-
-    wb.add_named_style(header_style_s0)
-    wb.add_named_style(header_style_s1)
-    wb.add_named_style(header_style_s2)
-    wb.add_named_style(description_style_s3)
-
-    # --- Заголовки ---
-    # Строка 1 - объединенные ячейки согласно требованиям
-    # Создаем строку с правильным распределением текста по объединенным ячейкам
-    row1_data = [''] * 43  # Создаем пустую строку из 43 ячеек
-    
-    # Заполняем ячейки, которые будут объединены
-    ws.append(row1_data)
-    
-    # Объединение ячеек в строке 1
-    ws.merge_cells('C1:K1')  # Основная информация C - K
-    ws.merge_cells('L1:L1')  # Размеры и Баркоды L
-    ws.merge_cells('M1:Q1')  # Габариты M - Q
-    ws.merge_cells('R1:V1')  # Документы R - V
-    ws.merge_cells('W1:AP1') # Дополнительная информация W - AP
-    ws.merge_cells('AQ1:AQ1') # Цены AQ
-    
-    # Заполняем объединенные ячейки текстом
-    ws['C1'] = 'Основная информация'
-    ws['L1'] = 'Размеры и Баркоды'
-    ws['M1'] = 'Габариты'
-    ws['R1'] = 'Документы'
-    ws['W1'] = 'Дополнительная информация'
-    ws['AQ1'] = 'Цены'
-    
-    for cell in ws[1]:
-        cell.style = header_style_s0
-    ws.row_dimensions[1].height = 41
-
-    # Строка 2 - такое же объединение как в строке 1
-    row2_data = [''] * 43
-    ws.append(row2_data)
-    
-    # Объединение ячеек в строке 2 (такое же как в строке 1)
-    ws.merge_cells('C2:K2')  # Основная информация C - K
-    ws.merge_cells('L2:L2')  # Размеры и Баркоды L
-    ws.merge_cells('M2:Q2')  # Габариты M - Q
-    ws.merge_cells('R2:V2')  # Документы R - V
-    ws.merge_cells('W2:AP2') # Дополнительная информация W - AP
-    ws.merge_cells('AQ2:AQ2') # Цены AQ
-    
-    for cell in ws[2]:
-        cell.style = header_style_s1
-    ws.row_dimensions[2].height = 63
-
-    # Строка 3 - заголовки столбцов
-    headers_row3 = ['Группа', 'Артикул продавца', 'Артикул WB', 'Наименование', 'Категория продавца', 'Бренд', 'Описание', 'Фото', 'Видео', 'Полное наименование товара', 'Состав', 'Баркод', 'Вес с упаковкой (кг)', 'Вес товара без упаковки (г)', 'Высота упаковки', 'Длина упаковки', 'Ширина упаковки', 'Дата окончания действия сертификата/декларации', 'Дата регистрации сертификата/декларации', 'Номер декларации соответствия', 'Номер сертификата соответствия', 'Свидетельство о регистрации СГР', 'SPF', 'Артикул OZON', 'Возрастные ограничения', 'Время нанесения', 'Действие', 'ИКПУ', 'Код упаковки', 'Комплектация', 'Назначение косметического средства', 'Назначение подарка', 'Объем товара', 'Повод', 'Раздел меню', 'Срок годности', 'Страна производства', 'ТНВЭД', 'Тип доставки', 'Тип кожи', 'Упаковка', 'Форма упаковки', 'Ставка НДС', '']
-    ws.append(headers_row3)
-    for cell in ws[3]:
-        cell.style = header_style_s2
-
-    ws.row_dimensions[3].height = 41
-    
-    # Строка 4 - описания
-    descriptions_row4 = [
-        '',
-        'Это номер или название, по которому вы сможете идентифицировать свой товар.',
-        'Уникальный идентификатор карточки, который присваивается после успешного создания товара.',
-        '',
-        'Категория выбирается строго из справочника, справочник можно посмотреть через единичное создание карточек.',
-        '',
-        'Если вы не заполните характеристики, то мы постараемся заполнить их сами из вашего описания или по фото товара.',
-        "Список ссылок на фотографии разделённый ';' (Количество - до 30 шт.)",
-        'Ссылка на видео (Количество - 1 шт.)',
-        'Максимальное количество значений: 1',
-        'Максимальное количество значений: 20',
-        '',
-        'Единица измерения: кг',
-        'Единица измерения: г',
-        'Единица измерения: см',
-        'Единица измерения: см',
-        'Единица измерения: см',
-        'Максимальное количество значений: 1',
-        'Максимальное количество значений: 1',
-        'Максимальное количество значений: 1',
-        'Максимальное количество значений: 1',
-        'Максимальное количество значений: 1',
-        'Максимальное количество значений: 3',
-        'Максимальное количество значений: 1',
-        'Максимальное количество значений: 3',
-        'Максимальное количество значений: 3',
-        'Максимальное количество значений: 3',
-        'Максимальное количество значений: 1',
-        'Максимальное количество значений: 1',
-        'Максимальное количество значений: 12',
-        'Максимальное количество значений: 3',
-        'Максимальное количество значений: 3',
-        'Единица измерения: мл',
-        'Максимальное количество значений: 3',
-        'Максимальное количество значений: 1',
-        'Максимальное количество значений: 3',
-        'Максимальное количество значений: 1',
-        'Максимальное количество значений: 1',
-        'Максимальное количество значений: 1',
-        'Максимальное количество значений: 1',
-        'Максимальное количество значений: 3',
-        'Максимальное количество значений: 1',
-        'Максимальное количество значений: 1',
-        ''
+        items = index.find_categories(query)
+    return cached_json_response(paginate(items, int_arg('offset', 0), int_arg('limit')), index.version)
+
+@app.route('/subjects/<subject_id>')
+def subject(subject_id):
+    """Предмет и колонки его шаблона."""
+    index = get_category_index()
+    info = index.subject(subject_id)
+    if info is None:
+        return json_response({'error': 'Unknown subject'}, 404)
+    return cached_json_response(info, index.version)
+
+# Парсинги выполняются в пуле задач, а не в потоке HTTP-запроса
+def run_job(targets=None, **params):
+    """Запуск задачи: пакетная (есть targets) или обычная."""
+    if targets is not None:
+        return batch_parser(targets, **params)
+    return stream_parser(**params)
+
+jobs = JobManager(run_job)
+
+def collect_runtime_metrics():
+    """Метрики, которые считаются в момент запроса /metrics: задачи, очереди, темп и соединения."""
+    connections = connection_stats()
+    return [
+        snapshot_gauge('parser_jobs', 'Задачи парсинга в памяти процесса по статусам', ('status',),
+                       [({'status': status}, count) for status, count in jobs.counts().items()]),
+        snapshot_gauge('parser_catalog_queue_depth', 'Товары со страниц каталога, ждущие загрузки карточек (по всем парсингам)', (),
+                       [({}, sum(queue.qsize() for queue in list(catalog_queues)))]),
+        snapshot_gauge('parser_rate_limit_rps', 'Текущий темп запросов регулятора по группам хостов', ('group',),
+                       [({'group': group}, stats['rate']) for group, stats in get_rate_control().stats().items()]),
+        snapshot_counter('parser_card_fetches_shared_total', 'Загрузки карточек, доставшиеся от параллельного парсинга без запроса', (),
+                         [({}, card_flights.shared)]),
+        snapshot_counter('parser_http_requests_total', 'HTTP-запросы по хостам', ('host',),
+                         [({'host': host}, stats['requests']) for host, stats in connections.items()]),
+        snapshot_counter('parser_http_connections_total', 'Новые TCP/TLS-соединения по хостам', ('host',),
+                         [({'host': host}, stats['connections']) for host, stats in connections.items()]),
     ]
-    ws.append(descriptions_row4)
-    for cell in ws[4]:
-        cell.style = description_style_s3
-    ws.row_dimensions[4].height = 56
-
-    # --- Закрепление столбцов A и B ---
-    ws.freeze_panes = 'C1'
-
-    # --- Данные ---
-    if data:
-        # Используем headers_row3 для обеспечения правильного порядка
-        for row_data in data:
-            row_to_append = []
-            for header in headers_row3:
-                 row_to_append.append(row_data.get(header, ''))
-            ws.append(row_to_append)
-            
-    # Устанавливаем ширину столбцов
-    for col in range(ord('A'), ord('Q') + 1):
-        ws.column_dimensions[chr(col)].width = 30
-
-    wb.save(output_path)
-    return output_path
-
-# --- Прочие вспомогательные функции (без изменений) ---
-def find_options_by_group_name(grouped_options, group_name): 
-    try: return next((g['options'] for g in grouped_options if g['group_name'] == group_name), [])
-    except (TypeError, KeyError): return []
 
-def find_value_in_arrays(*arrays, search_name):
-    for arr in arrays:
-        if not isinstance(arr, list): continue
-        for item in arr: 
-            if isinstance(item, dict) and item.get('name') == search_name: return item.get('value')
-    return ''
-
-def extract_number(value):
-    if not isinstance(value, str): return ''
-    match = re.search(r'\d+(?:[.,]\d+)?', value)
-    if match:
-        try: return float(match.group().replace(',', '.'))
-        except ValueError: return ''
-    return ''
-
-app = Flask(__name__, template_folder='public')
-
-@app.route('/')
-def index():
-    return render_template('index.html')
-
-@app.route('/stream')
-def stream():
-    seller_id = request.args.get('seller_id')
-    brand_id = request.args.get('brand_id')
-    xsubject_id = request.args.get('xsubject_id')
+REGISTRY.add_collector(collect_runtime_metrics)
 
+def parse_params(args):
+    """Параметры парсинга из запроса; None, если не хватает обязательных."""
+    seller_id = args.get('seller_id')
+    brand_id = args.get('brand_id')
     if not seller_id or not brand_id:
-        return Response(json.dumps({'error': 'Missing seller_id or brand_id'}), mimetype='application/json'), 400
+        return None
+    return {
+        'seller_id': seller_id,
+        'brand_id': brand_id,
+        'xsubject_id': args.get('xsubject_id') or None,
+        'incremental': args.get('incremental') in (True, '1', 'true'),
+        'resume': args.get('resume') not in (False, '0', 'false'),
+        'trace': args.get('trace') in (True, '1', 'true'),
+        'profile': args.get('profile') in (True, '1', 'true'),
+    }
+
+# Через сколько мс EventSource переподключается после обрыва (поле retry потока)
+SSE_RETRY_MS = 2000
+
+def last_event_id():
+    """
+    Заголовок Last-Event-ID, который EventSource присылает при переподключении:
+    (id задачи, номер последнего полученного события) или (None, 0).
+    """
+    job_id, _, seq = request.headers.get('Last-Event-ID', '').strip().rpartition(':')
+    if not job_id or not seq.isdigit():
+        return None, 0
+    return job_id, int(seq)
 
+def event_stream(job_id, after=0):
+    """
+    SSE-поток событий задачи; keepalive-комментарии не дают прокси закрыть соединение.
+    У событий есть id вида <задача>:<номер>: переподключившийся EventSource присылает его
+    в Last-Event-ID и получает только пропущенные события из буфера задачи.
+    Если задача уже завершилась и клиент получил все, отвечаем 204 — EventSource больше не переподключается.
+    Параметр запроса progress_interval (сек) делает события прогресса для этого клиента реже.
+    """
+    if after:
+        state = jobs.state(job_id)
+        if state is not None and state['status'] not in ACTIVE and after >= state.get('seq', 0):
+            return Response(status=204)
+    interval = client_interval(request.args.get('progress_interval'))
     def generate():
+        ACTIVE_STREAMS.inc()
         try:
-            for progress_update in stream_parser(seller_id, brand_id, xsubject_id):
-                yield f"data: {progress_update}\n\n"
-        except Exception as e:
-            error_message = json.dumps({'type': 'error', 'message': str(e)})
-            yield f"data: {error_message}\n\n"
+            yield f"retry: {SSE_RETRY_MS}\n\n"
+            events = jobs.subscribe(job_id, after)
+            if interval:
+                events = coalesce_progress(events, interval)
+            for event in events:
+                if event is None:
+                    yield ": keepalive\n\n"
+                    continue
+                seq, data = event
+                if seq is None:
+                    # Событие, восстановленное по состоянию задачи: без id, чтобы не сбить номер последнего события
+                    yield f"data: {data}\n\n"
+                else:
+                    yield f"id: {job_id}:{seq}\ndata: {data}\n\n"
+        finally:
+            ACTIVE_STREAMS.dec()
+    return Response(generate(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
-    return Response(generate(), mimetype='text/event-stream')
+@app.route('/stream')
+def stream():
+    """
+    Ставит парсинг в очередь и сразу транслирует его события (первое — {'type': 'job', 'job_id'}).
+    Переподключение с Last-Event-ID продолжает поток той же задачи, а не запускает новую.
+    """
+    resumed_job, seq = last_event_id()
+    if resumed_job and jobs.state(resumed_job) is not None:
+        return event_stream(resumed_job, seq)
+    params = parse_params(request.args)
+    if params is None:
+        return Response(dumps({'error': 'Missing seller_id or brand_id'}), mimetype='application/json'), 400
+    job = jobs.submit(params)
+    return event_stream(job.id)
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    params = parse_params(request.get_json(silent=True) or request.form or request.args)
+    if params is None:
+        return json_response({'error': 'Missing seller_id or brand_id'}, 400)
+    job = jobs.submit(params)
+    return json_response({'job_id': job.id, 'status': job.snapshot()['status']}, 202)
+
+def parse_batch_params(data):
+    """Параметры пакетной задачи: targets — список словарей или строк (см. parse_target)."""
+    if not isinstance(data, dict):
+        raise ValueError("Тело запроса должно быть JSON-объектом с полем targets.")
+    raw_targets = data.get('targets') or []
+    if not isinstance(raw_targets, list):
+        raise ValueError('Поле targets должно быть списком целей: строк "seller:brand[:xsubject]" или объектов с seller_id и brand_id.')
+    targets = []
+    for target in raw_targets:
+        if isinstance(target, str):
+            try:
+                target = parse_target(target)
+            except (ValueError, IndexError):
+                raise ValueError(f"Некорректная цель: {target}")
+        elif isinstance(target, dict) and target.get('seller_id') and target.get('brand_id'):
+            target = BatchTarget(target['seller_id'], target['brand_id'], target.get('xsubject_id'))
+        else:
+            raise ValueError(f"Некорректная цель: {target}")
+        targets.append(target.as_dict())
+    if not targets:
+        raise ValueError("Не указано ни одной цели для парсинга.")
+    return {'targets': targets, 'combined': bool(data.get('combined'))}
+
+@app.route('/batch', methods=['POST'])
+def create_batch_job():
+    """Ставит пакетный парсинг в очередь; события читаются через /jobs/<id>/events."""
+    try:
+        params = parse_batch_params(request.get_json(silent=True) or {})
+    except ValueError as e:
+        return json_response({'error': str(e)}, 400)
+    job = jobs.submit(params)
+    return json_response({'job_id': job.id, 'status': job.snapshot()['status']}, 202)
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    state = jobs.state(job_id)
+    if state is None:
+        return json_response({'error': 'Unknown job'}, 404)
+    return json_response(state)
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """События задачи начиная с номера after или Last-Event-ID (переподключение после обрыва)."""
+    if jobs.state(job_id) is None:
+        return json_response({'error': 'Unknown job'}, 404)
+    resumed_job, seq = last_event_id()
+    after = max(int_arg('after', 0), seq if resumed_job == job_id else 0)
+    return event_stream(job_id, after)
+
+@app.route('/metrics')
+def metrics():
+    """Метрики парсера в текстовом формате Prometheus."""
+    return Response(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/download/<path:filename>')
+def download(filename):
+    return send_from_directory('downloads', filename, as_attachment=True)
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,104 @@
+import os
+import re
+import threading
+from storage import data_path, read_json, write_json_atomic
+
+# Сколько корзин basket-NN перебирать, когда подсказок нет
+MAX_BASKET = int(os.environ.get('PARSER_MAX_BASKET', 12))
+
+_BASKET_HOST_RE = re.compile(r'^basket-(\d+)\.wbbasket\.ru$')
+
+
+def basket_host(number):
+    return f"basket-{number:02d}.wbbasket.ru"
+
+
+def basket_number(host):
+    match = _BASKET_HOST_RE.match(host or '')
+    return int(match.group(1)) if match else None
+
+
+class BasketResolver:
+    """
+    Запоминает, какая корзина отдала карточку для какого vol, и по этим диапазонам
+    предсказывает корзину для новых товаров. Номера корзин растут вместе с vol,
+    поэтому известные диапазоны ограничивают поиск сверху и снизу, а кандидаты
+    перебираются от предсказанной корзины в обе стороны, а не с basket-01.
+    Выученные диапазоны сохраняются на диск между запусками.
+    """
+    def __init__(self, path=None, max_basket=None):
+        self.path = path or data_path('baskets.json')
+        self.max_basket = max_basket or MAX_BASKET
+        self._ranges = {} # номер корзины -> [min vol, max vol]
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._loaded = False
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        for number, (low, high) in (read_json(self.path) or {}).items():
+            self._ranges[int(number)] = [low, high]
+
+    def record(self, vol, host):
+        """Запоминает, что карточка с этим vol нашлась на host."""
+        number = basket_number(host)
+        if number is None:
+            return
+        with self._lock:
+            self._load()
+            known = self._ranges.get(number)
+            if known is None:
+                self._ranges[number] = [vol, vol]
+            elif vol < known[0]:
+                known[0] = vol
+            elif vol > known[1]:
+                known[1] = vol
+            else:
+                return
+            self._dirty = True
+
+    def candidates(self, vol):
+        """Номера корзин в порядке проверки: сначала предсказанная, затем соседние."""
+        with self._lock:
+            self._load()
+            lower, upper, predicted = 1, max(self.max_basket, max(self._ranges, default=0)), None
+            below = above = None
+            for number, (low, high) in self._ranges.items():
+                if low <= vol <= high:
+                    predicted = number
+                    break
+                if high < vol and (below is None or number > below[0]):
+                    below = (number, vol - high)
+                if low > vol and (above is None or number < above[0]):
+                    above = (number, low - vol)
+
+        if predicted is None:
+            if below:
+                lower = below[0]
+            if above:
+                upper = above[0]
+            if below and above:
+                predicted = below[0] if below[1] <= above[1] else above[0]
+            elif below or above:
+                predicted = (below or above)[0]
+            else:
+                predicted = 1
+            if lower > upper:
+                lower, upper = upper, lower
+
+        numbers = range(lower, upper + 1) if lower <= predicted <= upper else range(1, upper + 1)
+        # Ближайшие к предсказанной корзине идут первыми, при равенстве — более новая
+        return sorted(numbers, key=lambda n: (abs(n - predicted), n < predicted))
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            ranges = {str(number): bounds[:] for number, bounds in sorted(self._ranges.items())}
+            self._dirty = False
+        try:
+            write_json_atomic(self.path, ranges)
+        except OSError:
+            pass
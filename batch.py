@@ -0,0 +1,87 @@
+import re
+import threading
+
+
+class BatchTarget:
+    """Одна цель пакетного парсинга: продавец, бренд(ы) и необязательный предмет."""
+    def __init__(self, seller_id, brand_id, xsubject_id=None):
+        self.seller_id = str(seller_id)
+        self.brand_id = str(brand_id)
+        self.xsubject_id = str(xsubject_id) if xsubject_id else None
+        self.total = 0
+
+    @property
+    def key(self):
+        return (self.seller_id, self.brand_id, self.xsubject_id)
+
+    @property
+    def label(self):
+        label = f"{self.seller_id}_{self.brand_id}"
+        if self.xsubject_id:
+            label += f"_{self.xsubject_id}"
+        return re.sub(r'[^0-9A-Za-z_]+', '-', label)
+
+    def as_dict(self):
+        return {'seller_id': self.seller_id, 'brand_id': self.brand_id, 'xsubject_id': self.xsubject_id}
+
+
+def unique_targets(targets):
+    """Убирает повторяющиеся цели, сохраняя порядок."""
+    seen = set()
+    result = []
+    for target in targets:
+        if target.key not in seen:
+            seen.add(target.key)
+            result.append(target)
+    return result
+
+
+class SharedProducts:
+    """
+    Дедупликация товаров между целями пакета. Товар, который уже ждет загрузки карточки,
+    не запрашивается второй раз: цель просто добавляется к его владельцам и получает
+    строку, когда карточка придет. Товар, который уже обработан, снова пропускается в поток
+    с карточкой из дискового кэша (без запроса), а в общий файл второй раз не пишется.
+    add() вызывается потоком, читающим каталог, finish() — потоком, пишущим результат.
+    """
+    def __init__(self, cache=None, combined=False):
+        self.cache = cache
+        self.combined = combined
+        self.duplicates = 0
+        self._owners = {} # id -> индексы целей, ждущих этот товар
+        self._done = set()
+        self._lock = threading.Lock()
+
+    def add(self, index, item):
+        """Возвращает товар, если его нужно отдать в загрузку, иначе None."""
+        product_id = str(item['id'])
+        with self._lock:
+            owners = self._owners.get(product_id)
+            if owners is not None:
+                if index not in owners:
+                    owners.append(index)
+                    self.duplicates += 1
+                return None
+            if product_id in self._done:
+                self.duplicates += 1
+                if self.combined:
+                    return None
+                cached = self.cache.get(product_id) if self.cache else None
+                if cached:
+                    item['advanced'] = cached['card']
+            self._owners[product_id] = [index]
+        return item
+
+    def finish(self, item):
+        """Цели, которым нужна строка с этим товаром."""
+        product_id = str(item['id'])
+        with self._lock:
+            self._done.add(product_id)
+            return self._owners.pop(product_id, [])
+
+    def products(self, listings):
+        """Поток товаров на загрузку из пар (индекс цели, товар)."""
+        for index, item in listings:
+            item = self.add(index, item)
+            if item is not None:
+                yield item
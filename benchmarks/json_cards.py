@@ -0,0 +1,57 @@
+"""
+Сравнение разбора card.json и сериализации событий: stdlib json + словари против json_backend + cards.Card.
+Запуск из корня проекта: python -m benchmarks.json_cards [число карточек]
+"""
+import sys
+import json
+import time
+import tracemalloc
+from benchmarks.samples import card_json, catalog_product
+import json_backend
+from cards import parse_card
+from mapping import DEFAULT_MAPPING
+
+
+def measure(label, fn, payloads):
+    tracemalloc.start()
+    started = time.perf_counter()
+    kept = [fn(payload) for payload in payloads]
+    elapsed = time.perf_counter() - started
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<34} {elapsed * 1000:9.1f} мс  {len(payloads) / elapsed:10.0f} /с  удержано {retained / 2**20:7.1f} МБ  пик {peak / 2**20:7.1f} МБ")
+    return kept, elapsed, retained
+
+
+def main(count=5000):
+    print(f"JSON backend: {json_backend.BACKEND}, карточек: {count}")
+    payloads = [json.dumps(card_json(100000000 + i), ensure_ascii=False).encode('utf-8') for i in range(count)]
+    print(f"Средний card.json: {sum(map(len, payloads)) / count / 1024:.1f} КБ")
+
+    dicts, t_old, m_old = measure('card.json: json.loads -> dict', json.loads, payloads)
+    cards, t_new, m_new = measure('card.json: parse_card -> Card', parse_card, payloads)
+    print(f"  быстрее в {t_old / t_new:.1f} раз, памяти на карточки меньше в {m_old / max(m_new, 1):.1f} раз")
+
+    # Строки таблицы должны совпадать
+    products = [catalog_product(100000000 + i) for i in range(count)]
+    mismatches = sum(
+        DEFAULT_MAPPING.row(dict(product, advanced=card)) != DEFAULT_MAPPING.row(dict(product, advanced=raw))
+        for product, card, raw in zip(products, cards, dicts)
+    )
+    print(f"Расхождений в строках таблицы: {mismatches}")
+    del dicts, cards
+
+    events = [{'type': 'progress', 'current': i, 'total': count, 'message': product['name'],
+               'row': {'id': product['id'], 'vendor_code': product['vendorCode'], 'mapped': True}} for i, product in enumerate(products)]
+    _, t_old, _ = measure('события: json.dumps', json.dumps, events)
+    _, t_new, _ = measure('события: json_backend.dumps', json_backend.dumps, events)
+    print(f"  быстрее в {t_old / t_new:.1f} раз")
+
+    pages = [json.dumps({'products': products[i:i + 100]}, ensure_ascii=False).encode('utf-8') for i in range(0, count, 100)]
+    _, t_old, _ = measure('каталог: json.loads', json.loads, pages)
+    _, t_new, _ = measure('каталог: json_backend.loads', json_backend.loads, pages)
+    print(f"  быстрее в {t_old / t_new:.1f} раз")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
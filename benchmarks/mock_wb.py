@@ -0,0 +1,274 @@
+"""
+Локальная замена WB для бенчмарков: catalog.wb.ru (filters, catalog), cdn.wbbasket.ru (upstreams)
+и basket-NN.wbbasket.ru (card.json) на одном HTTP-сервере. Хост запроса берется из заголовка Host.
+
+Данные либо синтезируются (benchmarks/samples.py), либо отдаются из каталога с записанными ответами:
+    filters.json, upstreams.json, catalog/<страница>.json, cards/<id товара>.json
+(save_fixtures() выгружает синтетический набор в той же раскладке).
+
+Настраиваются задержка ответа, доля 429, раскладка корзин: какая доля корзин есть в карте
+маршрутов (товары остальных ищутся перебором корзин с 404) и доля товаров без карточки.
+
+Отдельным процессом:
+    python -m benchmarks.mock_wb --products 1000 --latency 0.02 --throttle 0.01
+Парсер направляется на сервер через route_session(get_session(), url): запросы к https://<хост WB>/...
+уходят на http://127.0.0.1:<порт>/... с исходным Host.
+"""
+import os
+import re
+import sys
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+from http_client import PooledAdapter
+from json_backend import dumps_bytes
+from benchmarks.samples import card_json, catalog_product
+
+PAGE_SIZE = 100
+FIRST_PRODUCT_ID = 150000000
+# Шаг между id товаров: товары расходятся по разным vol, как у настоящего продавца
+PRODUCT_ID_STEP = 7919
+
+_CARD_PATH_RE = re.compile(r'^/vol(\d+)/part\d+/(\d+)/info/ru/card\.json$')
+_BASKET_RE = re.compile(r'^basket-(\d+)\.wbbasket\.ru$')
+
+
+class MockWB:
+    """
+    Данные и поведение заглушки. products — число товаров продавца; baskets — на сколько корзин
+    разложены карточки; route_coverage — доля корзин, попавших в карту маршрутов upstreams;
+    missing — доля товаров без card.json; latency/jitter — задержка ответа (сек);
+    throttle — вероятность ответа 429 (с Retry-After, если retry_after задан).
+    """
+    def __init__(self, products=1000, baskets=10, route_coverage=1.0, missing=0.0,
+                 latency=0.0, jitter=0.0, throttle=0.0, retry_after=None, fixtures=None, seed=1):
+        self.products = products
+        self.baskets = baskets
+        self.route_coverage = route_coverage
+        self.missing = missing
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle = throttle
+        self.retry_after = retry_after
+        self.fixtures = fixtures
+        self._random = random.Random(seed)
+        self._cards = {} # id -> (тело, ETag)
+        self._lock = threading.Lock()
+        self.stats = {} # (вид запроса, статус) -> число ответов
+
+        self.ids = [FIRST_PRODUCT_ID + i * PRODUCT_ID_STEP for i in range(products)]
+        self._vol_min = self.ids[0] // 100000 if self.ids else 0
+        self._vol_span = (self.ids[-1] // 100000 - self._vol_min + 1) if self.ids else 1
+        missing_rng = random.Random(seed + 1)
+        self._missing = {product_id for product_id in self.ids if missing_rng.random() < missing}
+
+    # --- данные ---
+
+    def basket_of(self, vol):
+        """Номер корзины, на которой лежит карточка с этим vol (vol растут вместе с номером корзины)."""
+        return 1 + (vol - self._vol_min) * self.baskets // self._vol_span
+
+    def upstreams(self):
+        covered = max(int(round(self.baskets * self.route_coverage)), 0)
+        hosts = []
+        for number in range(1, covered + 1):
+            # Диапазон vol корзины — обратная функция basket_of
+            start = self._vol_min + -(-(number - 1) * self._vol_span // self.baskets)
+            end = self._vol_min + -(-number * self._vol_span // self.baskets) - 1
+            hosts.append({'vol_range_from': start, 'vol_range_to': end, 'host': f'basket-{number:02d}.wbbasket.ru'})
+        return {'recommend': {'mediabasket_route_map': [{'hosts': hosts}]}}
+
+    def filters(self):
+        return {'data': {'total': self.products, 'filters': []}}
+
+    def catalog_page(self, page, seller_id=1):
+        ids = self.ids[(page - 1) * PAGE_SIZE:page * PAGE_SIZE]
+        return {'products': [catalog_product(product_id, seller_id) for product_id in ids]}
+
+    def card(self, product_id):
+        """(тело, ETag) card.json; None, если карточки нет."""
+        cached = self._cards.get(product_id)
+        if cached is None:
+            if product_id in self._missing:
+                return None
+            body = dumps_bytes(card_json(product_id))
+            cached = (body, '"%s"' % hashlib.md5(body).hexdigest())
+            with self._lock:
+                self._cards[product_id] = cached
+        return cached
+
+    def _fixture(self, *parts):
+        try:
+            with open(os.path.join(self.fixtures, *parts), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    # --- обработка запроса ---
+
+    def respond(self, host, path, query, headers):
+        """Возвращает (вид запроса, статус, заголовки, тело)."""
+        kind = 'card' if host.startswith('basket-') else path.rsplit('/', 1)[-1] or 'root'
+        if self.latency or self.jitter:
+            time.sleep(max(self.latency + self._random.uniform(-self.jitter, self.jitter), 0))
+        if self.throttle and self._random.random() < self.throttle:
+            extra = {'Retry-After': str(self.retry_after)} if self.retry_after is not None else {}
+            return kind, 429, extra, b''
+
+        if host == 'cdn.wbbasket.ru' and path == '/api/v3/upstreams':
+            return kind, 200, {}, self._fixture('upstreams.json') if self.fixtures else dumps_bytes(self.upstreams())
+        if host == 'catalog.wb.ru' and path == '/sellers/v8/filters':
+            return kind, 200, {}, self._fixture('filters.json') if self.fixtures else dumps_bytes(self.filters())
+        if host == 'catalog.wb.ru' and path == '/sellers/v4/catalog':
+            page = int(query.get('page', ['1'])[0])
+            if self.fixtures:
+                body = self._fixture('catalog', f'{page}.json')
+                return (kind, 200, {}, body) if body is not None else (kind, 200, {}, b'{"products":[]}')
+            seller_id = int(query.get('supplier', ['1'])[0].split(';')[0] or 1)
+            return kind, 200, {}, dumps_bytes(self.catalog_page(page, seller_id))
+
+        match = _BASKET_RE.match(host)
+        card_match = _CARD_PATH_RE.match(path)
+        if match and card_match:
+            vol, product_id = int(card_match.group(1)), int(card_match.group(2))
+            if self.fixtures:
+                body = self._fixture('cards', f'{product_id}.json')
+                return (kind, 200, {}, body) if body is not None else (kind, 404, {}, b'')
+            if int(match.group(1)) != self.basket_of(vol):
+                return kind, 404, {}, b''
+            card = self.card(product_id)
+            if card is None:
+                return kind, 404, {}, b''
+            body, etag = card
+            if headers.get('If-None-Match') == etag:
+                return kind, 304, {'ETag': etag}, b''
+            return kind, 200, {'ETag': etag}, body
+        return kind, 404, {}, b''
+
+    def record(self, kind, status):
+        with self._lock:
+            self.stats[(kind, status)] = self.stats.get((kind, status), 0) + 1
+
+    def save_fixtures(self, directory):
+        """Выгружает синтетический набор в раскладке, которую понимает режим fixtures."""
+        os.makedirs(os.path.join(directory, 'catalog'), exist_ok=True)
+        os.makedirs(os.path.join(directory, 'cards'), exist_ok=True)
+        files = {'upstreams.json': self.upstreams(), 'filters.json': self.filters()}
+        for page in range(1, -(-self.products // PAGE_SIZE) + 1):
+            files[os.path.join('catalog', f'{page}.json')] = self.catalog_page(page)
+        for name, data in files.items():
+            with open(os.path.join(directory, name), 'wb') as f:
+                f.write(dumps_bytes(data))
+        for product_id in self.ids:
+            card = self.card(product_id)
+            if card is not None:
+                with open(os.path.join(directory, 'cards', f'{product_id}.json'), 'wb') as f:
+                    f.write(card[0])
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # keep-alive, как у настоящих хостов WB
+    disable_nagle_algorithm = True # заголовки и тело уходят разными write: без этого +40 мс на ответ
+
+    def do_GET(self):
+        mock = self.server.mock
+        parts = urlsplit(self.path)
+        host = (self.headers.get('Host') or '').split(':')[0]
+        kind, status, headers, body = mock.respond(host, parts.path, parse_qs(parts.query), self.headers)
+        mock.record(kind, status)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockServer:
+    """HTTP-сервер заглушки в фоновом потоке. url — адрес, на который перенаправлять запросы."""
+    def __init__(self, mock, host='127.0.0.1', port=0):
+        self.mock = mock
+        self.httpd = ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.request_queue_size = 128
+        self.httpd.mock = mock
+        self.url = f"http://{host}:{self.httpd.server_address[1]}"
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class MockRoutingAdapter(PooledAdapter):
+    """Отправляет запросы к хостам WB на заглушку, сохраняя исходный Host и URL ответа."""
+    def __init__(self, target, **kwargs):
+        super().__init__(**kwargs)
+        self.target = target.rstrip('/')
+
+    def send(self, request, **kwargs):
+        original_url = request.url
+        parts = urlsplit(original_url)
+        request = request.copy()
+        request.url = self.target + parts.path + (f'?{parts.query}' if parts.query else '')
+        request.headers['Host'] = parts.hostname
+        response = super().send(request, **kwargs)
+        response.url = original_url
+        return response
+
+
+def route_session(session, target, pool_hosts=None, pool_size=None):
+    """Перенаправляет все запросы сессии (https и http) на заглушку по адресу target."""
+    adapter = MockRoutingAdapter(target, pool_connections=pool_hosts or 64, pool_maxsize=pool_size or 64)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Локальная заглушка WB для бенчмарков')
+    parser.add_argument('--port', type=int, default=0)
+    parser.add_argument('--products', type=int, default=1000)
+    parser.add_argument('--baskets', type=int, default=10)
+    parser.add_argument('--route-coverage', type=float, default=1.0, help='доля корзин в карте маршрутов')
+    parser.add_argument('--missing', type=float, default=0.0, help='доля товаров без card.json')
+    parser.add_argument('--latency', type=float, default=0.0, help='задержка ответа, сек')
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--throttle', type=float, default=0.0, help='доля ответов 429')
+    parser.add_argument('--retry-after', type=int)
+    parser.add_argument('--fixtures', help='каталог с записанными ответами')
+    parser.add_argument('--save-fixtures', help='выгрузить синтетический набор в каталог и выйти')
+    args = parser.parse_args(argv)
+
+    mock = MockWB(args.products, args.baskets, args.route_coverage, args.missing, args.latency,
+                  args.jitter, args.throttle, args.retry_after, args.fixtures)
+    if args.save_fixtures:
+        mock.save_fixtures(args.save_fixtures)
+        return
+    server = MockServer(mock, port=args.port)
+    print(server.url, flush=True) # Первая строка вывода — адрес для бенчмарка
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        for (kind, status), count in sorted(mock.stats.items()):
+            print(f"{kind}\t{status}\t{count}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,256 @@
+"""
+Бенчмарк парсера целиком против локальной заглушки WB (benchmarks/mock_wb.py), без сети.
+
+    python -m benchmarks.run --sizes 100,1000,10000 --latency 0.01
+    python -m benchmarks.run --output bench.json               # сохранить результат
+    python -m benchmarks.run --baseline bench.json             # код выхода 1 при падении скорости
+
+Для каждого размера запускаются отдельный процесс заглушки и отдельный процесс замера
+с чистым PARSER_DATA_DIR, так что кэши одного размера не влияют на другой, а пик RSS
+относится к одному прогону. В процессе замера по очереди выполняются:
+  stream — stream_parser от карты маршрутов до готового xlsx;
+  batch  — старый путь: все карточки в память, затем map_data и create_excel_file.
+Время этапов — сумма по всем вызовам; у загрузки карточек это сумма по потокам пула.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import signal
+import argparse
+import tempfile
+import resource
+import threading
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SELLER_ID = '1'
+BRAND_ID = '2'
+
+
+class StageTimers:
+    """Суммарное время и число вызовов по этапам; обертки ставятся поверх функций модулей."""
+    def __init__(self):
+        self.seconds = {}
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, elapsed):
+        with self._lock:
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + elapsed
+            self.calls[stage] = self.calls.get(stage, 0) + 1
+
+    def wrap(self, owner, name, stage):
+        original = getattr(owner, name)
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.add(stage if isinstance(stage, str) else stage(*args, **kwargs), time.perf_counter() - started)
+        setattr(owner, name, timed)
+
+    def reset(self):
+        with self._lock:
+            result = {stage: {'seconds': round(self.seconds[stage], 3), 'calls': self.calls[stage]} for stage in sorted(self.seconds)}
+            self.seconds, self.calls = {}, {}
+        return result
+
+
+def request_stage(url, *args, **kwargs):
+    if 'upstreams' in url:
+        return 'route_map'
+    if '/filters' in url:
+        return 'total'
+    return 'catalog_page'
+
+
+def peak_rss_mb():
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def measure(size, mock_url, workers=None, rps=None, skip_batch=False):
+    """Замер в текущем процессе (PARSER_DATA_DIR и рабочий каталог уже временные)."""
+    import pipeline
+    import card_fetcher
+    import excel_writer
+    import mapping
+    from http_client import get_session
+    from basket_resolver import BasketResolver
+    from rate_control import fixed_rate_control, get_rate_control
+    from benchmarks.mock_wb import route_session
+
+    route_session(get_session(), mock_url)
+    timers = StageTimers()
+    timers.wrap(pipeline, 'make_request', request_stage)
+    timers.wrap(card_fetcher, 'fetch_card', 'card_fetch')
+    timers.wrap(mapping.ColumnMapping, 'row', 'mapping')
+    for name in ('append', 'append_values', 'close'):
+        timers.wrap(excel_writer.ExcelStreamWriter, name, 'excel_write')
+    results = {'size': size}
+
+    started = time.perf_counter()
+    products = 0
+    output = None
+    for raw in pipeline.stream_parser(SELLER_ID, BRAND_ID, workers=workers, requests_per_second=rps, resume=False):
+        event = json.loads(raw)
+        if event['type'] == 'progress':
+            products = event['current']
+        elif event['type'] == 'result':
+            output = event
+    elapsed = time.perf_counter() - started
+    results['stream'] = {
+        'seconds': round(elapsed, 3),
+        'products': products,
+        'rows': output['total'] if output else 0,
+        'products_per_sec': round(products / elapsed, 1) if elapsed else 0,
+        'peak_rss_mb': peak_rss_mb(),
+        'stages': timers.reset(),
+    }
+
+    if not skip_batch:
+        rate_control = fixed_rate_control(rps) if rps else get_rate_control()
+        started = time.perf_counter()
+        baskets = pipeline.get_mediabasket_route_map()
+        total = pipeline.fetch_products_total(SELLER_ID, BRAND_ID, rate_control=rate_control)
+        listing = pipeline.iter_catalog_products(SELLER_ID, BRAND_ID, None, -(-total // 100), rate_control)
+        items = list(card_fetcher.fetch_cards(listing, baskets, pipeline.headers, pipeline.get_host_by_range, workers=workers,
+                                              rate_control=rate_control, resolver=BasketResolver(path='batch_baskets.json')))
+        fetched = time.perf_counter()
+        rows = pipeline.map_data(items, baskets)
+        mapped = time.perf_counter()
+        pipeline.create_excel_file(rows)
+        elapsed = time.perf_counter() - started
+        stages = timers.reset()
+        stages['map_data'] = {'seconds': round(mapped - fetched, 3), 'calls': 1}
+        stages['create_excel_file'] = {'seconds': round(started + elapsed - mapped, 3), 'calls': 1}
+        results['batch'] = {
+            'seconds': round(elapsed, 3),
+            'products': len(items),
+            'rows': len(rows),
+            'products_per_sec': round(len(items) / elapsed, 1) if elapsed else 0,
+            'peak_rss_mb': peak_rss_mb(),
+            'stages': stages,
+        }
+    return results
+
+
+def start_mock(size, args):
+    command = [sys.executable, '-m', 'benchmarks.mock_wb', '--products', str(size),
+               '--latency', str(args.latency), '--jitter', str(args.jitter), '--throttle', str(args.throttle),
+               '--route-coverage', str(args.route_coverage), '--missing', str(args.missing), '--baskets', str(args.baskets)]
+    if args.retry_after is not None:
+        command += ['--retry-after', str(args.retry_after)]
+    if args.fixtures:
+        command += ['--fixtures', os.path.abspath(args.fixtures)]
+    process = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    url = process.stdout.readline().strip()
+    if not url.startswith('http'):
+        process.kill()
+        raise RuntimeError(f"Заглушка WB не запустилась: {process.stderr.read()}")
+    return process, url
+
+
+def run_size(size, args):
+    """Заглушка и замер в отдельных процессах; возвращает результат замера и счетчики заглушки."""
+    workdir = tempfile.mkdtemp(prefix='wb-bench-')
+    mock, url = start_mock(size, args)
+    try:
+        env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''),
+                   PARSER_DATA_DIR=os.path.join(workdir, 'data'), PARSER_PRELOAD_TEMPLATES='0')
+        command = [sys.executable, '-m', 'benchmarks.run', '--child', url, '--sizes', str(size)]
+        if args.workers:
+            command += ['--workers', str(args.workers)]
+        command += ['--rps', str(args.rps)]
+        if args.skip_batch:
+            command.append('--skip-batch')
+        child = subprocess.run(command, cwd=workdir, env=env, stdout=subprocess.PIPE, text=True)
+        if child.returncode != 0:
+            raise RuntimeError(f"Замер {size} завершился с кодом {child.returncode}")
+        result = json.loads(child.stdout.strip().splitlines()[-1])
+    finally:
+        mock.send_signal(signal.SIGINT) # заглушка печатает счетчики при остановке
+        _, stats = mock.communicate(timeout=10)
+        shutil.rmtree(workdir, ignore_errors=True)
+    result['upstream'] = {}
+    for line in stats.splitlines():
+        kind, status, count = line.split('\t')
+        result['upstream'][f'{kind} {status}'] = int(count)
+    return result
+
+
+def print_report(results):
+    for result in results:
+        print(f"\n=== {result['size']} SKU ===")
+        for mode in ('stream', 'batch'):
+            run = result.get(mode)
+            if not run:
+                continue
+            print(f"{mode:<7} {run['products_per_sec']:>9.1f} товаров/с  {run['seconds']:>8.2f} с  "
+                  f"пик RSS {run['peak_rss_mb']:>7.1f} МБ  строк {run['rows']}")
+            for stage, timing in run['stages'].items():
+                print(f"        {stage:<18} {timing['seconds']:>9.3f} с  вызовов {timing['calls']}")
+        print('upstream: ' + ', '.join(f"{key}: {count}" for key, count in sorted(result['upstream'].items())))
+
+
+def check_baseline(results, path, tolerance):
+    """Сравнивает товаров/с с сохраненным прогоном; возвращает список регрессий."""
+    with open(path, encoding='utf-8') as f:
+        baseline = {entry['size']: entry for entry in json.load(f)}
+    regressions = []
+    for result in results:
+        old = baseline.get(result['size'])
+        for mode in ('stream', 'batch'):
+            if not old or mode not in old or mode not in result:
+                continue
+            before, after = old[mode]['products_per_sec'], result[mode]['products_per_sec']
+            if before and after < before * (1 - tolerance):
+                regressions.append(f"{result['size']} SKU {mode}: {after} товаров/с против {before} ({(after / before - 1) * 100:+.0f}%)")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Бенчмарк парсера против локальной заглушки WB')
+    parser.add_argument('--sizes', default='100,1000,10000', help='число товаров через запятую')
+    parser.add_argument('--workers', type=int, help='потоков загрузки карточек (по умолчанию PARSER_CARD_WORKERS)')
+    parser.add_argument('--rps', type=float, default=500, help='фиксированный темп запросов; 0 — адаптивный регулятор')
+    parser.add_argument('--latency', type=float, default=0.01, help='задержка ответа заглушки, сек')
+    parser.add_argument('--jitter', type=float, default=0.005)
+    parser.add_argument('--throttle', type=float, default=0.0, help='доля ответов 429')
+    parser.add_argument('--retry-after', type=int)
+    parser.add_argument('--route-coverage', type=float, default=1.0, help='доля корзин в карте маршрутов')
+    parser.add_argument('--missing', type=float, default=0.0, help='доля товаров без card.json')
+    parser.add_argument('--baskets', type=int, default=10)
+    parser.add_argument('--fixtures', help='каталог с записанными ответами WB (см. benchmarks/mock_wb.py)')
+    parser.add_argument('--skip-batch', action='store_true', help='не замерять map_data/create_excel_file')
+    parser.add_argument('--output', help='сохранить результат в JSON')
+    parser.add_argument('--baseline', help='JSON прошлого прогона для сравнения')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='допустимое падение товаров/с')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+
+    if args.child:
+        print(json.dumps(measure(sizes[0], args.child, args.workers, args.rps or None, args.skip_batch)))
+        return 0
+
+    results = []
+    for size in sizes:
+        print(f"{size} SKU...", file=sys.stderr, flush=True)
+        results.append(run_size(size, args))
+    print_report(results)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        regressions = check_baseline(results, args.baseline, args.tolerance)
+        for line in regressions:
+            print(f"РЕГРЕССИЯ: {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
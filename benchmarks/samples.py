@@ -0,0 +1,56 @@
+"""Правдоподобные ответы WB (выдача каталога и card.json) для бенчмарков без сети."""
+import random
+
+OPTION_NAMES = [
+    'Состав', 'Вес с упаковкой (кг)', 'Вес товара без упаковки (г)', 'Высота упаковки', 'Длина упаковки',
+    'Ширина упаковки', 'SPF', 'Возрастные ограничения', 'Время нанесения', 'Действие', 'Комплектация',
+    'Назначение косметического средства', 'Объем товара', 'Срок годности', 'Страна производства',
+    'ТН ВЭД', 'Тип кожи', 'Упаковка', 'Цвет', 'Пол', 'Особенности', 'Эффект',
+]
+WORDS = 'крем увлажняющий для лица с гиалуроновой кислотой и витамином питательный ночной дневной'.split()
+
+
+def text(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def catalog_product(product_id, seller_id=1, rng=None):
+    """Товар из выдачи catalog.wb.ru/sellers/v4/catalog."""
+    rng = rng or random.Random(product_id)
+    return {
+        'id': product_id, 'root': product_id // 3, 'kindId': 0, 'brand': 'Бренд', 'brandId': 2,
+        'siteBrandId': 0, 'colors': [{'name': 'белый', 'id': 16777215}], 'subjectId': 363,
+        'subjectParentId': 1, 'name': text(rng, 4), 'entity': '', 'supplier': 'Продавец',
+        'supplierId': seller_id, 'supplierRating': 4.8, 'supplierFlags': 0, 'pics': rng.randint(1, 12),
+        'rating': 5, 'reviewRating': round(rng.uniform(3, 5), 1), 'feedbacks': rng.randint(0, 500),
+        'volume': 1, 'viewFlags': 0, 'vendorCode': f'ART-{product_id}',
+        'sizes': [{'name': '', 'origName': '0', 'rank': 0, 'optionId': product_id * 10,
+                   'stocks': [{'wh': 507, 'dtype': 4, 'qty': rng.randint(0, 50), 'priority': 1, 'time1': 3, 'time2': 20}],
+                   'price': {'basic': 150000, 'product': 99000, 'total': 99000, 'logistics': 0, 'return': 0}}],
+        'totalQuantity': rng.randint(0, 50), 'logs': '', 'meta': {'tokens': [], 'presetId': 0},
+    }
+
+
+def card_json(product_id, rng=None):
+    """card.json с basket-NN: кроме нужных таблице полей, медиа, цвета, размеры и служебные данные."""
+    rng = rng or random.Random(product_id)
+    names = rng.sample(OPTION_NAMES, 14)
+    options = [{'name': name, 'value': f'{rng.randint(1, 500)} {text(rng, 2)}', 'is_variable': False, 'charc_type': 1} for name in names[:8]]
+    groups = [
+        {'group_name': group, 'options': [{'name': name, 'value': f'{rng.randint(1, 500)} см', 'charc_type': 4} for name in names[8 + i * 3:11 + i * 3]]}
+        for i, group in enumerate(['Габариты', 'Дополнительная информация'])
+    ]
+    return {
+        'imt_id': product_id // 3, 'nm_id': product_id, 'imt_name': text(rng, 5), 'slug': 'krem-dlya-litsa',
+        'subj_name': 'Кремы', 'subj_root_name': 'Красота', 'vendor_code': f'ART-{product_id}',
+        'description': text(rng, 150), 'options': options, 'grouped_options': groups,
+        'compositions': [{'name': text(rng, 1)} for _ in range(5)],
+        'certificates': [{'__name': 'Декларация ЕАЭС', 'number': f'ЕАЭС N RU Д-{product_id}', 'start_date': '2023-01-01', 'end_date': '2028-01-01', 'verified': True}],
+        'nm_colors_names': 'белый', 'colors': [product_id + i for i in range(8)],
+        'contents': text(rng, 6), 'full_colors': [{'nm_id': product_id + i} for i in range(8)],
+        'selling': {'no_return_map': 0, 'brand_name': 'Бренд', 'brand_hash': 'ABCDEF12', 'supplier_id': 1},
+        'media': {'has_video': True, 'photo_count': 12},
+        'data': {'subject_id': 363, 'subject_root_id': 1, 'chrt_ids': [product_id * 10], 'tech_size': '0'},
+        'sizes_table': {'details_props': ['Длина', 'Ширина'], 'values': [{'tech_size': '0', 'chrt_id': product_id * 10, 'details': ['10', '5']}]},
+        'grouped_options_meta': [{'id': i, 'hash': f'{rng.getrandbits(64):016x}'} for i in range(10)],
+    }
@@ -0,0 +1,108 @@
+import os
+import gzip
+import tempfile
+import threading
+from storage import data_path
+from json_backend import loads, dumps_bytes
+
+# Предельный размер кэша карточек на диске
+CARD_CACHE_MAX_MB = float(os.environ.get('PARSER_CARD_CACHE_MAX_MB', 512))
+
+
+class CardCache:
+    """
+    Кэш card.json на диске: один сжатый файл на товар (data/cards/<последние 2 цифры id>/<id>.json.gz)
+    вместе с ETag/Last-Modified и хостом, который отдал карточку.
+    По ним запрос делается условным, а ответ 304 обслуживается из кэша.
+    При превышении лимита размера удаляются давно не использованные файлы (по mtime).
+    """
+    def __init__(self, directory=None, max_bytes=None):
+        self.directory = directory or data_path('cards')
+        self.max_bytes = max_bytes if max_bytes is not None else int(CARD_CACHE_MAX_MB * 1024 * 1024)
+        self._size = None
+        self._lock = threading.Lock()
+
+    def _path(self, product_id):
+        product_id = str(product_id)
+        return os.path.join(self.directory, product_id[-2:], f"{product_id}.json.gz")
+
+    def get(self, product_id):
+        """Запись кэша ({'card', 'etag', 'last_modified', 'host'}) или None."""
+        path = self._path(product_id)
+        try:
+            with gzip.open(path, 'rb') as f:
+                entry = loads(f.read())
+        except (OSError, ValueError, EOFError):
+            return None
+        return entry
+
+    def touch(self, product_id):
+        """Отмечает использование записи, чтобы она не вытеснялась первой."""
+        try:
+            os.utime(self._path(product_id))
+        except OSError:
+            pass
+
+    def conditional_headers(self, entry):
+        conditional = {}
+        if entry.get('etag'):
+            conditional['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            conditional['If-Modified-Since'] = entry['last_modified']
+        return conditional
+
+    def put(self, product_id, card, response_headers=None, host=None):
+        response_headers = response_headers or {}
+        entry = {
+            'card': card,
+            'etag': response_headers.get('ETag'),
+            'last_modified': response_headers.get('Last-Modified'),
+            'host': host,
+        }
+        path = self._path(product_id)
+        directory = os.path.dirname(path)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb') as f:
+                f.write(dumps_bytes(entry))
+            os.replace(tmp_path, path)
+            new_size = os.path.getsize(path)
+        except OSError:
+            return
+        with self._lock:
+            if self._size is not None:
+                self._size += new_size - old_size
+        self._evict_if_needed()
+
+    def _scan(self):
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if not name.endswith('.json.gz'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def _evict_if_needed(self):
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._scan())
+            if self._size <= self.max_bytes:
+                return
+            # Освобождаем с запасом, чтобы не сканировать каталог на каждой записи
+            target = self.max_bytes * 0.9
+            for _, size, path in sorted(self._scan()):
+                if self._size <= target:
+                    break
+                try:
+                    os.remove(path)
+                    self._size -= size
+                except OSError:
+                    continue
@@ -0,0 +1,220 @@
+import os
+import queue
+import weakref
+import threading
+from collections import deque
+from itertools import chain
+from concurrent.futures import Future, ThreadPoolExecutor
+import requests
+from rate_control import controlled_get, get_rate_control
+from cards import Card, parse_card
+from basket_resolver import basket_host, MAX_BASKET
+from metrics import CARD_FETCH_SECONDS, CARD_RESULTS, BASKET_PROBES, CARDS_IN_FLIGHT
+from tracing import bind
+
+# Настройки параллельной загрузки карточек (можно переопределить через переменные окружения)
+CARD_WORKERS = int(os.environ.get('PARSER_CARD_WORKERS', 8))
+# Сколько товаров со страниц каталога может ждать загрузки карточек
+CATALOG_QUEUE_SIZE = int(os.environ.get('PARSER_CATALOG_QUEUE_SIZE', 200))
+
+_END = object()
+# Очереди prefetch работающих парсингов: их суммарная длина отдается в /metrics
+catalog_queues = weakref.WeakSet()
+
+
+class SingleFlight:
+    """
+    Объединяет одновременные вызовы с одним ключом: функцию выполняет первый вызвавший,
+    остальные ждут и получают его результат (или его исключение).
+    Ключ живет только пока вызов выполняется — это не кэш.
+    """
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.shared = 0 # сколько вызовов обошлись без собственного запроса
+
+    def do(self, key, fn):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+            else:
+                self.shared += 1
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+# Общий на процесс: одинаковые card.json из параллельных парсингов запрашиваются один раз
+card_flights = SingleFlight()
+
+
+def card_url(product_id, host):
+    return f"https://{host}/vol{product_id[:-5]}/part{product_id[:-3]}/{product_id}/info/ru/card.json"
+
+
+def fetch_card(item, baskets, headers, rate_control, get_host_by_range, retries=3, resolver=None, cache=None):
+    """
+    Загружает card.json одного товара и кладет его в item['advanced'].
+    Темп запросов и паузы после 429/ошибок задает общий rate_control.
+    Если карта маршрутов не дала хост, корзины перебираются в порядке,
+    предложенном resolver (без него — basket-01..MAX_BASKET).
+    Если карточка есть в cache, запрос делается условным и 304 отдается из кэша.
+    """
+    productId = str(item['id'])
+    vol = int(productId[:-5])
+    backetName = get_host_by_range(vol, baskets)
+    isAutoServer = bool(backetName)
+    if isAutoServer:
+        hosts = [backetName]
+    else:
+        numbers = resolver.candidates(vol) if resolver else range(1, MAX_BASKET + 1)
+        hosts = (basket_host(number) for number in numbers)
+
+    cached = cache.get(productId) if cache else None
+    if cached:
+        headers = dict(headers, **cache.conditional_headers(cached))
+        if not isAutoServer and cached.get('host'):
+            # Сначала спрашиваем корзину, которая уже отдавала эту карточку
+            hosts = chain([cached['host']], (host for host in hosts if host != cached['host']))
+
+    item['advanced'] = {}
+    failed = False # Какая-то из перебираемых корзин не ответила
+    for host in hosts:
+        try:
+            with CARD_FETCH_SECONDS.time(host=host):
+                productResponse = controlled_get(card_url(productId, host), headers=headers, timeout=5, retries=retries, control=rate_control)
+            if productResponse.status_code == 200:
+                item['advanced'] = parse_card(productResponse.content)
+                if cache:
+                    cache.put(productId, item['advanced'], productResponse.headers, host)
+                if resolver:
+                    resolver.record(vol, host)
+                _count_result('ok', isAutoServer)
+                return item # Успех
+        except requests.exceptions.RequestException:
+            if not isAutoServer:
+                failed = True
+                continue # Попытки для этой корзины исчерпаны, карточка может быть на следующей
+            CARD_RESULTS.inc(result='error')
+            return item # Попытки для корзины из карты маршрутов исчерпаны
+        except ValueError:
+            CARD_RESULTS.inc(result='error')
+            return item # Корзина ответила, но card.json не разобрать
+
+        if productResponse.status_code == 304 and cached:
+            item['advanced'] = Card.from_dict(cached['card'])
+            cache.touch(productId)
+            if resolver:
+                resolver.record(vol, host)
+            _count_result('not_modified', isAutoServer)
+            return item # Карточка не менялась
+
+        if not isAutoServer and productResponse.status_code == 404:
+            BASKET_PROBES.inc(result='miss')
+            continue # Пробуем следующую корзину
+
+        # Для всех других ошибок выходим и не сохраняем данные
+        CARD_RESULTS.inc(result='not_found' if productResponse.status_code == 404 else 'error')
+        return item
+
+    CARD_RESULTS.inc(result='error' if failed else 'not_found')
+    return item # Перебрали все корзины
+
+
+def _count_result(result, routed):
+    CARD_RESULTS.inc(result=result)
+    if not routed:
+        BASKET_PROBES.inc(result='hit')
+
+
+def fetch_card_shared(item, baskets, headers, rate_control, get_host_by_range, resolver=None, cache=None, flights=None):
+    """fetch_card через single-flight: пока карточка товара уже загружается, второй запрос не делается."""
+    def load():
+        return fetch_card(item, baskets, headers, rate_control, get_host_by_range, resolver=resolver, cache=cache)['advanced']
+    item['advanced'] = (flights or card_flights).do(str(item['id']), load)
+    return item
+
+
+def fetch_cards(items, baskets, headers, get_host_by_range, workers=None, rate_control=None, resolver=None, cache=None):
+    """
+    Параллельно загружает карточки для потока товаров.
+    Одновременно в работе не больше workers * 2 товаров; результаты отдаются
+    строго в исходном порядке, по мере готовности.
+    Товары, у которых карточка уже есть (item['advanced']), не запрашиваются повторно
+    и отдаются, как только загружены все товары перед ними.
+    """
+    workers = workers or CARD_WORKERS
+    rate_control = rate_control or get_rate_control()
+    in_flight = deque()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for item in items:
+                CARDS_IN_FLIGHT.inc()
+                if 'advanced' in item:
+                    done = Future()
+                    done.set_result(item)
+                    in_flight.append(done)
+                else:
+                    in_flight.append(executor.submit(bind(fetch_card_shared), item, baskets, headers, rate_control, get_host_by_range, resolver=resolver, cache=cache))
+                # Готовые товары в голове окна отдаются сразу: иначе товары с карточками
+                # (снимок, контрольная точка, общий кэш пакета) копились бы до конца каталога
+                while len(in_flight) >= workers * 2 or (in_flight and in_flight[0].done()):
+                    CARDS_IN_FLIGHT.dec()
+                    yield in_flight.popleft().result()
+            while in_flight:
+                CARDS_IN_FLIGHT.dec()
+                yield in_flight.popleft().result()
+    finally:
+        CARDS_IN_FLIGHT.dec(len(in_flight)) # Парсинг прервался с товарами в окне
+
+
+def prefetch(iterable, maxsize=None):
+    """
+    Выполняет итератор в фоновом потоке, складывая элементы в ограниченную очередь.
+    Производитель ждет, пока в очереди освободится место, поэтому память ограничена maxsize.
+    Исключение производителя пробрасывается потребителю.
+    """
+    buffer = queue.Queue(maxsize=maxsize or CATALOG_QUEUE_SIZE)
+    catalog_queues.add(buffer)
+    stop = threading.Event()
+
+    def put(value):
+        while not stop.is_set():
+            try:
+                buffer.put(value, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def produce():
+        try:
+            for value in iterable:
+                if stop.is_set():
+                    return
+                put(value)
+        except Exception as e:
+            put(e)
+        put(_END)
+
+    threading.Thread(target=bind(produce), daemon=True).start()
+    try:
+        while True:
+            value = buffer.get()
+            if value is _END:
+                return
+            if isinstance(value, Exception):
+                raise value
+            yield value
+    finally:
+        stop.set()
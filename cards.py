@@ -0,0 +1,65 @@
+from json_backend import loads
+from mapping import build_option_index
+
+# Поля сертификата, которые нужны для таблицы
+CERTIFICATE_FIELDS = ('end_date', 'start_date', '__name', 'number')
+
+
+class Card:
+    """
+    Карточка товара в том объеме, который нужен таблице: название, описание, корневая категория,
+    характеристики (сразу индексом имя -> значение, группы уже развернуты) и сертификаты.
+    Остальные поля card.json (медиа, размеры, цвета и т.п.) отбрасываются при разборе,
+    а __slots__ не держит словарь атрибутов на каждый объект.
+    Для кода, работающего со словарем карточки, есть get() и to_dict().
+    """
+    __slots__ = ('name', 'description', 'subj_root_name', 'option_index', 'certificates')
+
+    def __init__(self, name='', description='', subj_root_name='', option_index=None, certificates=()):
+        self.name = name
+        self.description = description
+        self.subj_root_name = subj_root_name
+        self.option_index = option_index or {}
+        self.certificates = tuple(certificates)
+
+    @classmethod
+    def from_dict(cls, data):
+        if isinstance(data, cls):
+            return data
+        certificates = []
+        for cert in data.get('certificates') or []:
+            if isinstance(cert, dict):
+                certificates.append({key: cert[key] for key in CERTIFICATE_FIELDS if key in cert})
+        return cls(
+            name=data.get('name', ''),
+            description=data.get('description', ''),
+            subj_root_name=data.get('subj_root_name', ''),
+            option_index=build_option_index(data),
+            certificates=certificates,
+        )
+
+    def get(self, key, default=None):
+        if key == 'options':
+            return [{'name': name, 'value': value} for name, value in self.option_index.items()]
+        if key == 'certificates':
+            return list(self.certificates)
+        if key in ('name', 'description', 'subj_root_name'):
+            return getattr(self, key)
+        return default
+
+    def to_dict(self):
+        """Компактный card.json: так карточка хранится в кэше, снимках и контрольных точках."""
+        data = {'name': self.name, 'description': self.description, 'subj_root_name': self.subj_root_name}
+        if self.option_index:
+            data['options'] = self.get('options')
+        if self.certificates:
+            data['certificates'] = list(self.certificates)
+        return data
+
+
+def parse_card(content):
+    """Разбирает тело ответа card.json (bytes или str) в Card."""
+    data = loads(content)
+    if not isinstance(data, dict):
+        raise ValueError('card.json: ожидался объект')
+    return Card.from_dict(data)
@@ -0,0 +1,128 @@
+import re
+import json
+import hashlib
+import threading
+from mapping import SUBCATEGORIES_PATH
+
+# Размер страницы /categories по умолчанию и верхняя граница
+CATEGORIES_PAGE_SIZE = 50
+CATEGORIES_MAX_PAGE_SIZE = 500
+
+_SPLIT_RE = re.compile(r'[^0-9a-zа-я]+')
+
+
+def normalize(text):
+    """Приводит название к виду для поиска: регистр, ё -> е, знаки препинания -> пробел."""
+    text = (text or '').casefold().replace('ё', 'е')
+    return ' '.join(_SPLIT_RE.split(text)).strip()
+
+
+class SearchIndex:
+    """
+    Префиксный индекс по словам названий: каждый префикс каждого слова -> номера записей.
+    Запрос ищет записи, где каждое слово запроса является началом какого-то слова названия;
+    записи, название которых целиком начинается с запроса, идут первыми.
+    """
+    def __init__(self, names):
+        self.names = list(names)
+        self._normalized = [normalize(name) for name in self.names]
+        self._prefixes = {}
+        for position, normalized in enumerate(self._normalized):
+            for token in set(normalized.split()):
+                for length in range(1, len(token) + 1):
+                    self._prefixes.setdefault(token[:length], set()).add(position)
+
+    def search(self, query):
+        """Позиции найденных записей в исходном порядке (пустой запрос — все записи)."""
+        query = normalize(query)
+        if not query:
+            return list(range(len(self.names)))
+        found = None
+        for token in query.split():
+            positions = self._prefixes.get(token, set())
+            found = positions if found is None else found & positions
+            if not found:
+                return []
+        return sorted(found, key=lambda position: (not self._normalized[position].startswith(query), position))
+
+
+class CategoryIndex:
+    """
+    subcategories.json, прочитанный один раз: список категорий, предметы каждой категории,
+    поисковые индексы по названиям и id предмета -> колонки шаблона.
+    version — хэш файла, из него строятся ETag ответов.
+    """
+    def __init__(self, path=None):
+        with open(path or SUBCATEGORIES_PATH, 'rb') as f:
+            raw = f.read()
+        tree = json.loads(raw.decode('utf-8'))
+        self.version = hashlib.sha1(raw).hexdigest()[:16]
+
+        self.categories = list(tree)
+        self.subjects = {} # категория -> [(название, id)]
+        self.columns = {} # id предмета -> колонки
+        self.subject_names = {} # id предмета -> (категория, название)
+        for category, subcategories in tree.items():
+            subjects = []
+            for name, info in subcategories.items():
+                subject_id = str(info.get('id') or '') if isinstance(info, dict) else ''
+                columns = (info.get('columns') or info.get('column')) if isinstance(info, dict) else None
+                subjects.append((name, subject_id if columns else ''))
+                if subject_id and columns:
+                    self.columns[subject_id] = columns
+                    self.subject_names[subject_id] = (category, name)
+            self.subjects[category] = subjects
+
+        self._category_index = SearchIndex(self.categories)
+        self._subject_indexes = {category: SearchIndex(name for name, _ in subjects) for category, subjects in self.subjects.items()}
+
+    def find_categories(self, query=''):
+        """Категории по запросу: название, число предметов и есть ли среди них настроенные."""
+        found = []
+        for position in self._category_index.search(query):
+            category = self.categories[position]
+            subjects = self.subjects[category]
+            found.append({
+                'name': category,
+                'subcategories': len(subjects),
+                'enabled': any(subject_id for _, subject_id in subjects),
+            })
+        return found
+
+    def find_subcategories(self, category, query=''):
+        """Предметы категории по запросу; None, если категории нет."""
+        if category not in self.subjects:
+            return None
+        subjects = self.subjects[category]
+        return [
+            {'name': subjects[position][0], 'id': subjects[position][1] or None, 'enabled': bool(subjects[position][1])}
+            for position in self._subject_indexes[category].search(query)
+        ]
+
+    def subject(self, subject_id):
+        """Предмет с колонками шаблона или None."""
+        subject_id = str(subject_id)
+        if subject_id not in self.columns:
+            return None
+        category, name = self.subject_names[subject_id]
+        return {'id': subject_id, 'name': name, 'category': category, 'columns': self.columns[subject_id]}
+
+
+def paginate(items, offset=0, limit=None):
+    """Срез списка для ответа API вместе с общим количеством."""
+    offset = max(offset, 0)
+    limit = CATEGORIES_PAGE_SIZE if limit is None else max(1, min(limit, CATEGORIES_MAX_PAGE_SIZE))
+    return {'items': items[offset:offset + limit], 'total': len(items), 'offset': offset, 'limit': limit}
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_category_index():
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = CategoryIndex()
+    return _index
@@ -0,0 +1,186 @@
+import os
+import gzip
+import time
+import threading
+from storage import data_path
+from snapshots import snapshot_key
+from json_backend import loads, dumps
+
+# Как часто контрольная точка сбрасывается на диск (сек)
+CHECKPOINT_INTERVAL = float(os.environ.get('PARSER_CHECKPOINT_INTERVAL', 5))
+# Контрольные точки старше этого срока не используются: каталог успел измениться (сек)
+CHECKPOINT_TTL = float(os.environ.get('PARSER_CHECKPOINT_TTL', 24 * 3600))
+
+# Файлы контрольных точек, которые сейчас ведут парсинги этого процесса
+_claimed = set()
+_claimed_lock = threading.Lock()
+
+
+class Checkpoint:
+    """
+    Контрольная точка незавершенного парсинга seller/brand/xsubject: товары с загруженными
+    карточками и номера страниц каталога, все товары которых уже обработаны.
+    Файл дописывается (gzip, JSON lines) по ходу парсинга и удаляется после успешного завершения;
+    если парсинг прервался, повторный запуск берет из него готовые страницы и карточки.
+    Обрыв записи на середине не страшен: читается все, что успело попасть в файл.
+    Файл ведет только парсинг, закрепивший его через claim(); без этого контрольная точка
+    ничего не читает, не пишет и не удаляет.
+    """
+    def __init__(self, seller_id, brand_id, xsubject_id=None, directory=None):
+        self.path = os.path.join(directory or data_path('checkpoints'), f"{snapshot_key(seller_id, brand_id, xsubject_id)}.jsonl.gz")
+        self.items = {} # id -> товар с карточкой из прошлого запуска (освобождается по мере выдачи)
+        self.pages_done = set()
+        self.total = None
+        self._start_total = None
+        self._saved = set() # id товаров, уже записанных в файл
+        self._page_items = {} # страница -> id товаров с карточками
+        self._pending = {} # страница -> сколько товаров еще не обработано
+        self._failed_pages = set()
+        self._page_of = {}
+        self._file = None
+        self._flushed_at = time.time()
+        self._lock = threading.Lock()
+        self.claimed = False
+
+    def claim(self):
+        """
+        Закрепляет файл за этим парсингом. False — тот же каталог уже парсит другая задача
+        (например, с другими флагами incremental/trace), и ее файл трогать нельзя.
+        """
+        with _claimed_lock:
+            if self.path in _claimed:
+                return False
+            _claimed.add(self.path)
+        self.claimed = True
+        return True
+
+    def release(self):
+        if self.claimed:
+            self.claimed = False
+            with _claimed_lock:
+                _claimed.discard(self.path)
+
+    def load(self, total):
+        """
+        Читает контрольную точку прошлого запуска. Она не используется, если устарела
+        или общее число товаров изменилось (страницы каталога сдвинулись).
+        Возвращает число восстановленных товаров.
+        """
+        self._start_total = total
+        if not self.claimed:
+            return 0
+        try:
+            if time.time() - os.path.getmtime(self.path) > CHECKPOINT_TTL:
+                self.clear()
+                return 0
+        except OSError:
+            return 0
+        entries = []
+        try:
+            with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    entries.append(loads(line))
+        except (OSError, EOFError, ValueError):
+            pass # Недописанный хвост файла пропускаем
+        if not entries or entries[0].get('total') != total:
+            self.clear()
+            return 0
+        for entry in entries[1:]:
+            if 'item' in entry:
+                product_id = str(entry['item']['id'])
+                self.items[product_id] = entry['item']
+                self._page_items.setdefault(entry['page'], []).append(product_id)
+            elif 'page_done' in entry:
+                self.pages_done.add(entry['page_done'])
+        self.total = total
+        self._saved = set(self.items)
+        return len(self.items)
+
+    def _write(self, entry, flush=False):
+        if not self.claimed:
+            return
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            if self.total is None:
+                self._file = gzip.open(self.path, 'wt', encoding='utf-8')
+                self._file.write(dumps({'total': self._start_total}) + '\n')
+                self.total = self._start_total
+            else:
+                # Новый gzip-член в конце файла: записи прошлого запуска остаются читаемыми
+                self._file = gzip.open(self.path, 'at', encoding='utf-8')
+        self._file.write(dumps(entry) + '\n')
+        if flush or time.time() - self._flushed_at >= CHECKPOINT_INTERVAL:
+            self._file.flush()
+            self._flushed_at = time.time()
+
+    def products(self, pages):
+        """
+        Пропускает поток страниц каталога (номер, товары), запоминая, какой товар с какой страницы.
+        Товары готовых страниц отдаются из контрольной точки вместе с карточками;
+        на остальных страницах уже загруженным товарам подставляется сохраненная карточка.
+        Такие товары fetch_cards не запрашивает и отдает дальше сразу, по порядку каталога,
+        поэтому строки и прогресс восстановленной части идут, пока дочитывается каталог.
+        """
+        for page, products in pages:
+            if page in self.pages_done:
+                for product_id in self._page_items.get(page, []):
+                    if product_id in self.items:
+                        yield self.items.pop(product_id)
+                continue
+            with self._lock:
+                self._pending[page] = len(products)
+                for item in products:
+                    self._page_of[str(item['id'])] = page
+                if not products:
+                    self._finish_page(page)
+            for item in products:
+                known = self.items.pop(str(item['id']), None)
+                if known is not None and known.get('advanced'):
+                    item['advanced'] = known['advanced']
+                yield item
+
+    def record(self, item):
+        """Отмечает товар обработанным; товар с карточкой попадает в контрольную точку."""
+        product_id = str(item['id'])
+        with self._lock:
+            page = self._page_of.pop(product_id, None)
+            if page is None:
+                return # Товар с уже готовой страницы
+            if item.get('advanced'):
+                if product_id not in self._saved:
+                    self._saved.add(product_id)
+                    self._write({'page': page, 'item': item})
+            else:
+                self._failed_pages.add(page)
+            self._pending[page] -= 1
+            if self._pending[page] == 0:
+                self._finish_page(page)
+
+    def _finish_page(self, page):
+        del self._pending[page]
+        # Страница с незагруженными карточками при следующем запуске читается заново
+        if page not in self._failed_pages:
+            self._write({'page_done': page}, flush=True)
+
+    def close(self):
+        """Сбрасывает контрольную точку на диск (парсинг прервался)."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def start(self, total):
+        """Начинает контрольную точку заново (resume=False): файл прошлого запуска удаляется."""
+        self.clear()
+        self._start_total = total
+
+    def clear(self):
+        """Удаляет контрольную точку (парсинг завершился)."""
+        self.close()
+        self.total = None
+        if not self.claimed:
+            return
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
@@ -0,0 +1,242 @@
+import os
+import uuid
+import datetime
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import PatternFill, Font, Alignment, NamedStyle
+from openpyxl.utils import get_column_letter
+from tracing import section
+
+# Строка 1-2: объединенные группы колонок (диапазон, заголовок группы)
+HEADER_GROUPS = [
+    ('C{row}:K{row}', 'C', 'Основная информация'),
+    ('L{row}:L{row}', 'L', 'Размеры и Баркоды'),
+    ('M{row}:Q{row}', 'M', 'Габариты'),
+    ('R{row}:V{row}', 'R', 'Документы'),
+    ('W{row}:AP{row}', 'W', 'Дополнительная информация'),
+    ('AQ{row}:AQ{row}', 'AQ', 'Цены'),
+]
+HEADER_COLUMNS = 43
+
+# Строка 3 - заголовки столбцов
+HEADERS_ROW3 = ['Группа', 'Артикул продавца', 'Артикул WB', 'Наименование', 'Категория продавца', 'Бренд', 'Описание', 'Фото', 'Видео', 'Полное наименование товара', 'Состав', 'Баркод', 'Вес с упаковкой (кг)', 'Вес товара без упаковки (г)', 'Высота упаковки', 'Длина упаковки', 'Ширина упаковки', 'Дата окончания действия сертификата/декларации', 'Дата регистрации сертификата/декларации', 'Номер декларации соответствия', 'Номер сертификата соответствия', 'Свидетельство о регистрации СГР', 'SPF', 'Артикул OZON', 'Возрастные ограничения', 'Время нанесения', 'Действие', 'ИКПУ', 'Код упаковки', 'Комплектация', 'Назначение косметического средства', 'Назначение подарка', 'Объем товара', 'Повод', 'Раздел меню', 'Срок годности', 'Страна производства', 'ТНВЭД', 'Тип доставки', 'Тип кожи', 'Упаковка', 'Форма упаковки', 'Ставка НДС', '']
+
+# Строка 4 - описания
+DESCRIPTIONS_ROW4 = [
+    '',
+    'Это номер или название, по которому вы сможете идентифицировать свой товар.',
+    'Уникальный идентификатор карточки, который присваивается после успешного создания товара.',
+    '',
+    'Категория выбирается строго из справочника, справочник можно посмотреть через единичное создание карточек.',
+    '',
+    'Если вы не заполните характеристики, то мы постараемся заполнить их сами из вашего описания или по фото товара.',
+    "Список ссылок на фотографии разделённый ';' (Количество - до 30 шт.)",
+    'Ссылка на видео (Количество - 1 шт.)',
+    'Максимальное количество значений: 1',
+    'Максимальное количество значений: 20',
+    '',
+    'Единица измерения: кг',
+    'Единица измерения: г',
+    'Единица измерения: см',
+    'Единица измерения: см',
+    'Единица измерения: см',
+    'Максимальное количество значений: 1',
+    'Максимальное количество значений: 1',
+    'Максимальное количество значений: 1',
+    'Максимальное количество значений: 1',
+    'Максимальное количество значений: 1',
+    'Максимальное количество значений: 3',
+    'Максимальное количество значений: 1',
+    'Максимальное количество значений: 3',
+    'Максимальное количество значений: 3',
+    'Максимальное количество значений: 3',
+    'Максимальное количество значений: 1',
+    'Максимальное количество значений: 1',
+    'Максимальное количество значений: 12',
+    'Максимальное количество значений: 3',
+    'Максимальное количество значений: 3',
+    'Единица измерения: мл',
+    'Максимальное количество значений: 3',
+    'Максимальное количество значений: 1',
+    'Максимальное количество значений: 3',
+    'Максимальное количество значений: 1',
+    'Максимальное количество значений: 1',
+    'Максимальное количество значений: 1',
+    'Максимальное количество значений: 1',
+    'Максимальное количество значений: 3',
+    'Максимальное количество значений: 1',
+    'Максимальное количество значений: 1',
+    ''
+]
+
+
+def _named_styles():
+    header_style_s0 = NamedStyle(name="header_style_s0")
+    header_style_s0.fill = PatternFill(start_color="ECDAFF", end_color="ECDAFF", fill_type="solid")
+    header_style_s0.font = Font(name='Calibri', size=16)
+    header_style_s0.alignment = Alignment(vertical='bottom')
+
+    header_style_s1 = NamedStyle(name="header_style_s1")
+    header_style_s1.fill = PatternFill(start_color="ECDAFF", end_color="ECDAFF", fill_type="solid")
+    header_style_s1.font = Font(name='Calibri', size=12)
+    header_style_s1.alignment = Alignment(vertical='bottom')
+
+    header_style_s2 = NamedStyle(name="header_style_s2")
+    header_style_s2.fill = PatternFill(start_color="9A41FE", end_color="9A41FE", fill_type="solid")
+    header_style_s2.font = Font(name='Calibri', size=12, bold=True, color="FFFFFF")
+    header_style_s2.alignment = Alignment(vertical='center')
+
+    description_style_s3 = NamedStyle(name="description_style_s3")
+    description_style_s3.fill = PatternFill(start_color="F0F0F3", end_color="F0F0F3", fill_type="solid")
+    description_style_s3.font = Font(name='Calibri', size=10)
+    description_style_s3.alignment = Alignment(vertical='top', wrap_text=True)
+
+    return [header_style_s0, header_style_s1, header_style_s2, description_style_s3]
+
+
+class ExcelStreamWriter:
+    """
+    Потоковая запись итоговой таблицы через write-only режим openpyxl.
+    Заголовки (объединенные ячейки, именованные стили, закрепление) пишутся перед первой строкой,
+    а строки данных сразу уходят в файл, поэтому память не растет с размером каталога.
+    columns задает заголовки шаблона конкретного предмета; без него пишется исходная шапка
+    с группами колонок и описаниями. header (templates.TemplateHeader) переносит в шапку
+    группы, описания, стили и ширины из шаблона категории WB.
+    suffix дописывается к имени файла, чтобы файлы одного запуска не совпадали по имени;
+    случайная часть имени разводит файлы параллельных парсингов, начатых в одну секунду.
+    """
+    def __init__(self, output_path=None, directory="downloads", columns=None, header=None, suffix=''):
+        if output_path is None:
+            if not os.path.exists(directory):
+                os.makedirs(directory, exist_ok=True)
+            filename = f"result_{datetime.datetime.now():%Y-%m-%d_%H-%M-%S}_{uuid.uuid4().hex[:8]}{suffix}.xlsx"
+            output_path = os.path.join(directory, filename)
+        self.output_path = output_path
+        self.header = header
+        self.columns = header.columns if header is not None else (columns or HEADERS_ROW3)
+        self.rows_written = 0
+        self.closed = False
+
+        self.wb = Workbook(write_only=True)
+        for style in _named_styles():
+            self.wb.add_named_style(style)
+        self.ws = self.wb.create_sheet()
+
+    def _styled_row(self, values, style):
+        row = []
+        for value in values:
+            cell = WriteOnlyCell(self.ws, value=value)
+            cell.style = style
+            row.append(cell)
+        return row
+
+    def _template_cell(self, value, style):
+        cell = WriteOnlyCell(self.ws, value=value)
+        if style is None:
+            return cell
+        cell.font = style['font']
+        cell.fill = style['fill']
+        cell.alignment = style['alignment']
+        cell.border = style['border']
+        return cell
+
+    def _write_template_header(self):
+        ws, header = self.ws, self.header
+        for row_idx, height in header.heights.items():
+            ws.row_dimensions[row_idx].height = height
+        for column, width in header.widths.items():
+            ws.column_dimensions[column].width = width
+        if header.freeze:
+            ws.freeze_panes = header.freeze
+        for row in header.rows:
+            ws.append([self._template_cell(value, style) for value, style in row])
+        for cell_range in header.merges:
+            ws.merged_cells.add(cell_range)
+
+    def _write_header(self):
+        ws = self.ws
+        if self.header is not None:
+            ws.title = 'Товары' # Как в шаблоне загрузки WB
+            self._write_template_header()
+            return
+        # Размеры строк и столбцов в write-only режиме задаются до записи данных
+        for row_idx, height in ((1, 41), (2, 63), (3, 41), (4, 56)):
+            ws.row_dimensions[row_idx].height = height
+        for col in range(ord('A'), ord('Q') + 1):
+            ws.column_dimensions[chr(col)].width = 30
+
+        # --- Закрепление столбцов A и B ---
+        ws.freeze_panes = 'C1'
+
+        if self.columns is not HEADERS_ROW3:
+            width = len(self.columns)
+            ws.append(self._styled_row([''] * width, 'header_style_s0'))
+            ws.append(self._styled_row([''] * width, 'header_style_s1'))
+            ws.append(self._styled_row(self.columns, 'header_style_s2'))
+            ws.append(self._styled_row([''] * width, 'description_style_s3'))
+            return
+
+        # Строки 1 и 2 - объединенные ячейки групп, текст только в первой строке
+        group_titles = {column: title for _, column, title in HEADER_GROUPS}
+        row1 = [''] * HEADER_COLUMNS
+        for idx in range(HEADER_COLUMNS):
+            column = get_column_letter(idx + 1)
+            if column in group_titles:
+                row1[idx] = group_titles[column]
+        ws.append(self._styled_row(row1, 'header_style_s0'))
+        ws.append(self._styled_row([''] * HEADER_COLUMNS, 'header_style_s1'))
+        for row_idx in (1, 2):
+            for cell_range, _, _ in HEADER_GROUPS:
+                ws.merged_cells.add(cell_range.format(row=row_idx))
+
+        ws.append(self._styled_row(HEADERS_ROW3, 'header_style_s2'))
+        ws.append(self._styled_row(DESCRIPTIONS_ROW4, 'description_style_s3'))
+
+    def append(self, row_data):
+        """Добавляет строку данных из словаря; порядок колонок задается self.columns."""
+        self.append_values([row_data.get(header, '') for header in self.columns])
+
+    def append_values(self, values):
+        """Добавляет строку данных, уже упорядоченную по колонкам."""
+        with section('excel_write'):
+            if not self.rows_written:
+                self._write_header() # Шапка пишется вместе с первой строкой, пустой файл не создается
+            self.ws.append(values)
+        self.rows_written += 1
+
+    def close(self):
+        """Сохраняет файл. Если не было ни одной строки данных, файл не создается и возвращается None."""
+        if not self.rows_written:
+            self.discard()
+            return None
+        with section('excel_close'):
+            try:
+                self.wb.save(self.output_path)
+            except Exception:
+                self.discard()
+                if os.path.exists(self.output_path):
+                    os.remove(self.output_path) # Недописанный xlsx
+                raise
+        self.closed = True
+        return self.output_path
+
+    def discard(self):
+        """
+        Бросает файл без сохранения (парсинг упал или прерван): закрывает лист и удаляет
+        временный файл openpyxl, который иначе остается в /tmp до конца процесса.
+        После close() ничего не делает.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        ws = self.ws
+        writer = ws._writer # Создается при первой записи в лист
+        if writer is None:
+            return
+        if not ws.closed:
+            try:
+                ws.close()
+            except Exception:
+                writer.close() # Лист не дописать (например, упал save): просто закрываем файл
+        if os.path.exists(writer.out):
+            writer.cleanup()
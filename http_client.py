@@ -0,0 +1,111 @@
+import os
+import threading
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+# Размеры пулов соединений: сколько хостов держать и сколько соединений на хост
+POOL_HOSTS = int(os.environ.get('PARSER_POOL_HOSTS', 64))
+POOL_SIZE_PER_HOST = int(os.environ.get('PARSER_POOL_SIZE_PER_HOST', 16))
+# Повторы неудавшихся подключений внутри адаптера, в обход регулятора темпа. По умолчанию выключены:
+# все повторы (429/503, обрывы, таймауты) делает rate_control.controlled_get с паузами и метриками
+HTTP_RETRIES = int(os.environ.get('PARSER_HTTP_RETRIES', 0))
+
+_stats = {}
+_stats_lock = threading.Lock()
+_session = None
+_session_lock = threading.Lock()
+
+
+def _record(host, field):
+    with _stats_lock:
+        host_stats = _stats.setdefault(host, {'requests': 0, 'connections': 0})
+        host_stats[field] += 1
+
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        _record(self.host, 'connections')
+        return super()._new_conn()
+
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        _record(self.host, 'connections')
+        return super()._new_conn()
+
+
+class PooledAdapter(HTTPAdapter):
+    """HTTPAdapter, который считает новые TCP/TLS-соединения по каждому хосту."""
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _CountingHTTPConnectionPool,
+            'https': _CountingHTTPSConnectionPool,
+        }
+
+
+def _count_request(response, *args, **kwargs):
+    _record(urlparse(response.url).hostname, 'requests')
+
+
+def create_session(pool_hosts=None, pool_size=None, retries=None):
+    """
+    Создает сессию с keep-alive пулами на каждый хост. Адаптер повторяет только неудавшиеся
+    подключения (и по умолчанию не повторяет ничего): ответы 5xx и Retry-After он не трогает,
+    их обрабатывает регулятор темпа.
+    """
+    retries = HTTP_RETRIES if retries is None else retries
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=0,
+        status=0,
+        other=0,
+        backoff_factor=0.5,
+        status_forcelist=(),
+        respect_retry_after_header=False,
+        allowed_methods=frozenset(['GET']),
+        raise_on_status=False,
+    )
+    adapter = PooledAdapter(
+        pool_connections=pool_hosts or POOL_HOSTS,
+        pool_maxsize=pool_size or POOL_SIZE_PER_HOST,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.hooks['response'].append(_count_request)
+    return session
+
+
+def get_session():
+    """Общая для процесса сессия: соединения с catalog.wb.ru и basket-NN переиспользуются."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+    return _session
+
+
+def connection_stats():
+    """
+    Статистика по хостам: число запросов, открытых соединений и переиспользований.
+    reused = requests - connections, т.е. запросы, обошедшиеся без нового рукопожатия.
+    """
+    with _stats_lock:
+        return {
+            host: dict(s, reused=max(s['requests'] - s['connections'], 0))
+            for host, s in _stats.items()
+        }
+
+
+def format_connection_stats():
+    stats = connection_stats()
+    total_requests = sum(s['requests'] for s in stats.values())
+    total_connections = sum(s['connections'] for s in stats.values())
+    return f"HTTP: запросов {total_requests}, новых соединений {total_connections}, хостов {len(stats)}"
@@ -0,0 +1,269 @@
+import os
+import logging
+import json
+import time
+import uuid
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from storage import data_path, read_json, write_json_atomic
+from json_backend import loads, dumps
+
+logger = logging.getLogger(__name__)
+
+# Сколько парсингов выполняется одновременно; остальные ждут в очереди
+JOB_WORKERS = int(os.environ.get('PARSER_JOB_WORKERS', 2))
+# Сколько последних событий задачи хранится в памяти для переподключившихся клиентов
+JOB_EVENTS_KEPT = int(os.environ.get('PARSER_JOB_EVENTS_KEPT', 1000))
+# Как часто состояние задачи сбрасывается на диск во время прогресса (сек)
+JOB_STATE_INTERVAL = float(os.environ.get('PARSER_JOB_STATE_INTERVAL', 2))
+# Сколько завершенные задачи держатся в памяти (сек); состояние остается на диске
+JOB_RETENTION = float(os.environ.get('PARSER_JOB_RETENTION', 3600))
+# Пауза между keepalive-комментариями в потоке событий
+JOB_KEEPALIVE = 15
+
+ACTIVE = ('queued', 'running')
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (OSError, TypeError):
+        return True
+    return True
+
+
+class Job:
+    """
+    Задача парсинга: параметры, состояние (статус, прогресс, результат) и кольцевой буфер событий.
+    Каждое событие получает порядковый номер seq, по нему клиент продолжает подписку с места обрыва.
+    """
+    def __init__(self, job_id, params, path):
+        self.id = job_id
+        self.params = params
+        self.path = path
+        now = time.time()
+        self.state = {
+            'id': job_id, 'params': params, 'status': 'queued', 'pid': os.getpid(),
+            'created': now, 'updated': now, 'finished': None,
+            'current': 0, 'total': 0, 'message': '', 'result': None, 'error': None, 'seq': 0,
+        }
+        self.events = deque(maxlen=JOB_EVENTS_KEPT)
+        self.seq = 0
+        self.condition = threading.Condition()
+        self._saved_at = 0
+
+    @property
+    def active(self):
+        return self.state['status'] in ACTIVE
+
+    def _apply(self, event):
+        state = self.state
+        kind = event.get('type')
+        if kind == 'start':
+            state['total'] = event.get('total', 0)
+        elif kind == 'progress':
+            state['current'] = event.get('current', 0)
+            state['total'] = event.get('total', state['total'])
+        elif kind == 'result':
+            state['status'] = 'done'
+            state['result'] = {key: value for key, value in event.items() if key not in ('type', 'seq')}
+        elif kind == 'error':
+            state['status'] = 'failed'
+            state['error'] = event.get('message')
+        if event.get('message') and kind != 'error':
+            state['message'] = event['message']
+        state['updated'] = time.time()
+        if not self.active:
+            state['finished'] = state['updated']
+
+    def publish(self, event):
+        """Добавляет событие, обновляет состояние и будит подписчиков."""
+        with self.condition:
+            self.seq += 1
+            event['seq'] = self.seq
+            status = self.state['status']
+            self._apply(event)
+            self.state['seq'] = self.seq
+            self.events.append((self.seq, dumps(event)))
+            self.condition.notify_all()
+            # Прогресс пишется на диск не чаще раза в JOB_STATE_INTERVAL, смена статуса — сразу
+            force = status != self.state['status']
+        self.save(force)
+
+    def set_status(self, status):
+        with self.condition:
+            self.state['status'] = status
+            self.state['updated'] = time.time()
+            self.condition.notify_all()
+        self.save(True)
+
+    def save(self, force=False):
+        now = time.time()
+        if not force and now - self._saved_at < JOB_STATE_INTERVAL:
+            return
+        self._saved_at = now
+        with self.condition:
+            state = dict(self.state)
+        try:
+            write_json_atomic(self.path, state)
+        except OSError as e:
+            logger.exception("Не удалось сохранить состояние задачи %s: %s", self.id, e)
+
+    def snapshot(self):
+        with self.condition:
+            return dict(self.state)
+
+
+def status_events(state):
+    """
+    События, восстанавливающие картину задачи по ее сохраненному состоянию:
+    текущий статус и, для завершенной задачи, ее итог.
+    """
+    events = [{'type': 'status', **state}]
+    if state['status'] == 'done' and state.get('result'):
+        events.append({'type': 'result', **state['result']})
+    elif state['status'] == 'failed':
+        events.append({'type': 'error', 'message': state.get('error') or 'Ошибка парсинга'})
+    elif state['status'] == 'interrupted':
+        events.append({'type': 'error', 'message': 'Задача прервана перезапуском сервера. Запустите парсинг заново.'})
+    return [dumps(event) for event in events]
+
+
+class JobManager:
+    """
+    Очередь задач парсинга на локальном пуле потоков. HTTP-слой только ставит задачу
+    и читает ее события: разрыв соединения с клиентом задачу не останавливает.
+    Состояние задач сохраняется в data/jobs/<id>.json, поэтому статус доступен
+    и после завершения, и из других процессов.
+    runner(**params) — генератор JSON-строк событий (stream_parser).
+    """
+    def __init__(self, runner, workers=None, directory=None):
+        self.runner = runner
+        self.directory = directory or data_path('jobs')
+        self._executor = ThreadPoolExecutor(max_workers=workers or JOB_WORKERS, thread_name_prefix='parse-job')
+        self._jobs = {}
+        self._active_by_key = {}
+        self._lock = threading.Lock()
+
+    def _path(self, job_id):
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def submit(self, params):
+        """
+        Ставит парсинг в очередь и возвращает задачу. Если такая же задача уже
+        в очереди или выполняется, возвращается она — второй парсинг не запускается.
+        """
+        key = json.dumps(params, sort_keys=True)
+        with self._lock:
+            self._prune()
+            job = self._active_by_key.get(key)
+            if job is not None and job.active:
+                return job
+            job_id = uuid.uuid4().hex[:12]
+            job = Job(job_id, params, self._path(job_id))
+            self._jobs[job_id] = job
+            self._active_by_key[key] = job
+        job.publish({'type': 'job', 'job_id': job_id, 'message': 'Задача поставлена в очередь...'})
+        self._executor.submit(self._run, job, key)
+        return job
+
+    def _run(self, job, key):
+        job.set_status('running')
+        try:
+            for raw in self.runner(**job.params):
+                job.publish(loads(raw))
+            if job.active:
+                job.publish({'type': 'error', 'message': 'Парсинг завершился без результата.'})
+        except Exception as e:
+            job.publish({'type': 'error', 'message': str(e)})
+        finally:
+            with self._lock:
+                if self._active_by_key.get(key) is job:
+                    del self._active_by_key[key]
+
+    def _prune(self):
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            finished = job.state['finished']
+            if finished and now - finished > JOB_RETENTION:
+                del self._jobs[job_id]
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def counts(self):
+        """Число задач в памяти по статусам."""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        counts = {status: 0 for status in ACTIVE}
+        for job in jobs:
+            status = job.state['status']
+            counts[status] = counts.get(status, 0) + 1
+        return counts
+
+    def state(self, job_id):
+        """Текущее состояние задачи из памяти или с диска; None, если задачи нет."""
+        job = self.get(job_id)
+        if job is not None:
+            return job.snapshot()
+        state = read_json(self._path(job_id)) if job_id.isalnum() else None
+        if state and state['status'] in ACTIVE:
+            pid = state.get('pid')
+            # Процесс, выполнявший задачу, завершился, не дописав ее (тот же pid — значит, до перезапуска)
+            if pid == os.getpid() or not _pid_alive(pid):
+                state['status'] = 'interrupted'
+        return state
+
+    def subscribe(self, job_id, after=0, keepalive=JOB_KEEPALIVE):
+        """
+        Генератор пар (seq, JSON-строка) событий задачи с номером больше after; None — keepalive.
+        Если часть событий уже вытеснена из буфера, сначала отдается текущее состояние (с seq None:
+        у восстановленных по состоянию событий номера нет).
+        Для задачи другого процесса состояние перечитывается с диска, пока она не завершится.
+        """
+        job = self.get(job_id)
+        if job is None:
+            yield from self._follow_stored(job_id, keepalive)
+            return
+        while True:
+            with job.condition:
+                events = [(seq, data) for seq, data in job.events if seq > after]
+                if not events and job.active:
+                    job.condition.wait(keepalive)
+                    events = [(seq, data) for seq, data in job.events if seq > after]
+                active = job.active
+                state = dict(job.state)
+            if events and events[0][0] > after + 1:
+                yield None, status_events(state)[0]
+            for seq, data in events:
+                after = seq
+                yield seq, data
+            if not active and not events:
+                return
+            if not events:
+                yield None
+
+    def _follow_stored(self, job_id, keepalive):
+        last_update = None
+        waited = 0
+        while True:
+            state = self.state(job_id)
+            if state is None:
+                return
+            if state['status'] not in ACTIVE:
+                for data in status_events(state):
+                    yield None, data
+                return
+            if state['updated'] != last_update:
+                last_update = state['updated']
+                waited = 0
+                yield None, status_events(state)[0]
+            elif waited >= keepalive:
+                waited = 0
+                yield None
+            time.sleep(1)
+            waited += 1
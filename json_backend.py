@@ -0,0 +1,57 @@
+import os
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Библиотека для JSON: auto (orjson, если установлен), orjson или stdlib.
+# orjson входит в requirements.txt; stdlib — запасной вариант, заметно медленнее на карточках и событиях
+JSON_BACKEND = os.environ.get('PARSER_JSON_BACKEND', 'auto')
+
+BACKEND = 'orjson' if orjson is not None and JSON_BACKEND in ('auto', 'orjson') else 'stdlib'
+
+# Ошибка разбора у обеих реализаций — подкласс ValueError (orjson.JSONDecodeError наследует json.JSONDecodeError)
+DecodeError = json.JSONDecodeError
+
+
+def _default(obj):
+    """Объекты со своим представлением (например, cards.Card) сериализуются через to_dict()."""
+    to_dict = getattr(obj, 'to_dict', None)
+    if to_dict is not None:
+        return to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+if BACKEND == 'orjson':
+    _OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def loads(data):
+        return orjson.loads(data)
+
+    def dumps_bytes(obj):
+        try:
+            return orjson.dumps(obj, default=_default, option=_OPTIONS)
+        except TypeError:
+            # Например, целые длиннее 64 бит — их orjson не сериализует
+            return json.dumps(obj, ensure_ascii=False, default=_default).encode('utf-8')
+
+    def dumps(obj):
+        return dumps_bytes(obj).decode('utf-8')
+else:
+    def loads(data):
+        if isinstance(data, (bytes, bytearray)):
+            data = data.decode('utf-8')
+        return json.loads(data)
+
+    def dumps(obj):
+        return json.dumps(obj, ensure_ascii=False, default=_default)
+
+    def dumps_bytes(obj):
+        return dumps(obj).encode('utf-8')
+
+
+def response_json(response):
+    """Тело ответа requests как JSON; разбирается из байтов, без промежуточной строки."""
+    return loads(response.content)
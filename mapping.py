@@ -0,0 +1,241 @@
+import os
+import re
+import json
+import threading
+
+
+def extract_number(value):
+    if not isinstance(value, str): return ''
+    match = re.search(r'\d+(?:[.,]\d+)?', value)
+    if match:
+        try: return float(match.group().replace(',', '.'))
+        except ValueError: return ''
+    return ''
+
+
+def build_option_index(advanced):
+    """
+    Индекс характеристик карточки за один проход: имя -> значение.
+    Сначала плоский список options, затем все группы grouped_options;
+    при повторах побеждает первое встреченное значение.
+    У разобранной карточки (cards.Card) индекс уже построен.
+    """
+    prepared = getattr(advanced, 'option_index', None)
+    if prepared is not None:
+        return prepared
+    index = {}
+    for option in advanced.get('options') or []:
+        if isinstance(option, dict) and 'name' in option:
+            index.setdefault(option['name'], option.get('value'))
+    for group in advanced.get('grouped_options') or []:
+        if not isinstance(group, dict):
+            continue
+        for option in group.get('options') or []:
+            if isinstance(option, dict) and 'name' in option:
+                index.setdefault(option['name'], option.get('value'))
+    return index
+
+
+def certificate_fields(advanced):
+    """Даты и номер первого сертификата/декларации карточки."""
+    fields = {'end_date': '', 'start_date': '', 'declaration': '', 'certificate': '', 'sgr': ''}
+    certificates = advanced.get('certificates') or []
+    if certificates:
+        cert = certificates[0]
+        fields['end_date'] = cert.get('end_date', '')
+        fields['start_date'] = cert.get('start_date', '')
+        if 'ЕАЭС' in cert.get('__name', ''):
+            fields['declaration'] = cert.get('number', '')
+        else:
+            fields['certificate'] = cert.get('number', '')
+    return fields
+
+
+# --- Источники значений для колонок ---
+# Каждый источник — функция (item, advanced, options, cert) -> значение.
+def const(value):
+    return lambda item, advanced, options, cert: value
+
+def from_item(key):
+    return lambda item, advanced, options, cert: item.get(key, '')
+
+def from_card(key):
+    return lambda item, advanced, options, cert: advanced.get(key, '')
+
+def from_option(name, transform=None):
+    if transform is None:
+        return lambda item, advanced, options, cert: options.get(name, '')
+    return lambda item, advanced, options, cert: transform(options.get(name, ''))
+
+def from_cert(field):
+    return lambda item, advanced, options, cert: cert[field]
+
+
+# Колонки итоговой таблицы и откуда берется значение каждой
+COLUMN_SPEC = [
+    ('Группа', const('')),
+    ('Артикул продавца', from_item('vendorCode')),
+    ('Артикул WB', const('')),  # Оставляем пустым
+    ('Наименование', from_item('name')),
+    ('Категория продавца', from_card('subj_root_name')),
+    ('Бренд', from_item('brand')),
+    ('Описание', from_card('description')),
+    ('Фото', const('')),  # Оставляем пустым
+    ('Видео', const('')),  # Оставляем пустым
+    ('Полное наименование товара', from_card('name')),
+    ('Состав', from_option('Состав')),
+    ('Баркод', const('')),
+    ('Вес с упаковкой (кг)', from_option('Вес с упаковкой (кг)', extract_number)),
+    ('Вес товара без упаковки (г)', from_option('Вес товара без упаковки (г)', extract_number)),
+    ('Высота упаковки', from_option('Высота упаковки', extract_number)),
+    ('Длина упаковки', from_option('Длина упаковки', extract_number)),
+    ('Ширина упаковки', from_option('Ширина упаковки', extract_number)),
+    ('Дата окончания действия сертификата/декларации', from_cert('end_date')),
+    ('Дата регистрации сертификата/декларации', from_cert('start_date')),
+    ('Номер декларации соответствия', from_cert('declaration')),
+    ('Номер сертификата соответствия', from_cert('certificate')),
+    ('Свидетельство о регистрации СГР', from_cert('sgr')),
+    ('SPF', from_option('SPF')),
+    ('Артикул OZON', const('')),
+    ('Возрастные ограничения', from_option('Возрастные ограничения')),
+    ('Время нанесения', from_option('Время нанесения')),
+    ('Действие', from_option('Действие')),
+    ('ИКПУ', const('')),
+    ('Код упаковки', const('')),
+    ('Комплектация', from_option('Комплектация')),
+    ('Назначение косметического средства', from_option('Назначение косметического средства')),
+    ('Назначение подарка', const('')),
+    ('Объем товара', from_option('Объем товара', extract_number)),
+    ('Повод', const('')),
+    ('Раздел меню', const('')),
+    ('Срок годности', from_option('Срок годности')),
+    ('Страна производства', from_option('Страна производства')),
+    ('ТНВЭД', from_option('ТН ВЭД')),
+    ('Тип доставки', const('')),
+    ('Тип кожи', from_option('Тип кожи')),
+    ('Упаковка', from_option('Упаковка')),
+    ('Форма упаковки', const('')),
+    ('Ставка НДС', const('20')),
+]
+
+
+class ColumnMapping:
+    """
+    Скомпилированный набор колонок: порядок заголовков и источник значения для каждой.
+    row() отдает значения списком в порядке колонок, без промежуточного словаря.
+    """
+    def __init__(self, spec):
+        self.columns = [column for column, _ in spec]
+        self._sources = [source for _, source in spec]
+
+    def row(self, item):
+        advanced = item.get('advanced')
+        if not advanced: return None
+        options = build_option_index(advanced)
+        cert = certificate_fields(advanced)
+        return [source(item, advanced, options, cert) for source in self._sources]
+
+    def row_dict(self, item):
+        values = self.row(item)
+        return None if values is None else dict(zip(self.columns, values))
+
+
+# --- Колонки шаблонов WB по предметам (subcategories.json) ---
+SUBCATEGORIES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'subcategories.json')
+
+# Колонки, которые не берутся из карточки и остаются пустыми
+BLANK_COLUMNS = {
+    'Группа', 'Артикул WB', 'Фото', 'Видео', 'КИЗ', 'Баркод', 'Баркоды', 'Цена',
+    'Артикул OZON', 'ИКПУ', 'Код упаковки',
+}
+# Колонки, значение которых известно не из характеристик
+SPECIAL_SOURCES = {
+    'Артикул продавца': from_item('vendorCode'),
+    'Наименование': from_item('name'),
+    'Бренд': from_item('brand'),
+    'Категория продавца': from_card('subj_root_name'),
+    'Описание': from_card('description'),
+    'Полное наименование товара': from_card('name'),
+    'Дата окончания действия сертификата/декларации': from_cert('end_date'),
+    'Дата регистрации сертификата/декларации': from_cert('start_date'),
+    'Номер декларации соответствия': from_cert('declaration'),
+    'Номер сертификата соответствия': from_cert('certificate'),
+    'Свидетельство о регистрации СГР': from_cert('sgr'),
+    'Ставка НДС': const('20'),
+}
+# Название колонки шаблона отличается от названия характеристики в карточке
+OPTION_ALIASES = {
+    'ТНВЭД': 'ТН ВЭД',
+}
+# Колонки, где шаблон ждет число (единица измерения указана в описании колонки)
+NUMERIC_COLUMNS = {
+    'Вес с упаковкой (кг)', 'Вес товара без упаковки (г)', 'Вес товара с упаковкой (г)',
+    'Высота упаковки', 'Длина упаковки', 'Ширина упаковки', 'Объем товара',
+    'Высота предмета', 'Длина предмета', 'Ширина предмета', 'Глубина предмета',
+}
+
+DEFAULT_MAPPING = ColumnMapping(COLUMN_SPEC)
+
+
+def map_card(item):
+    """Строка таблицы (словарь) в исходном наборе колонок; None, если карточки нет."""
+    return DEFAULT_MAPPING.row_dict(item)
+
+
+_subject_columns = None
+_subject_categories = {}
+_subject_mappings = {}
+_subjects_lock = threading.Lock()
+
+
+def load_subject_columns():
+    """id предмета -> список колонок его шаблона. Файл читается один раз на процесс."""
+    global _subject_columns
+    if _subject_columns is None:
+        with open(SUBCATEGORIES_PATH, encoding='utf-8') as f:
+            tree = json.load(f)
+        columns_by_subject = {}
+        for category, subcategories in tree.items():
+            for info in subcategories.values():
+                if not isinstance(info, dict) or not info.get('id'):
+                    continue
+                # В части записей ключ называется 'column'
+                columns = info.get('columns') or info.get('column')
+                if columns:
+                    columns_by_subject[str(info['id'])] = columns
+                    _subject_categories[str(info['id'])] = category
+        _subject_columns = columns_by_subject
+    return _subject_columns
+
+
+def subject_category(subject_id):
+    """Название категории (и файла шаблона в shablon/) для предмета."""
+    load_subject_columns()
+    return _subject_categories.get(str(subject_id))
+
+
+def column_source(column):
+    if column in BLANK_COLUMNS:
+        return const('')
+    if column in SPECIAL_SOURCES:
+        return SPECIAL_SOURCES[column]
+    return from_option(OPTION_ALIASES.get(column, column), extract_number if column in NUMERIC_COLUMNS else None)
+
+
+def mapping_for_subject(subject_id):
+    """
+    ColumnMapping под шаблон предмета; компилируется один раз и хранится в памяти.
+    Для неизвестного предмета (или без него) возвращается DEFAULT_MAPPING.
+    """
+    if not subject_id:
+        return DEFAULT_MAPPING
+    subject_id = str(subject_id)
+    mapping = _subject_mappings.get(subject_id)
+    if mapping is None:
+        with _subjects_lock:
+            mapping = _subject_mappings.get(subject_id)
+            if mapping is None:
+                columns = load_subject_columns().get(subject_id)
+                mapping = ColumnMapping([(column, column_source(column)) for column in columns]) if columns else DEFAULT_MAPPING
+                _subject_mappings[subject_id] = mapping
+    return mapping
@@ -0,0 +1,243 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм по умолчанию (сек): от быстрых операций в памяти до медленных ответов WB
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Метрика с метками: значения хранятся по кортежу значений меток в порядке labelnames."""
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, _format_labels(self.labelnames, key), value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{labels} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """Гистограмма длительностей: накопленные корзины, сумма и число наблюдений по набору меток."""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][index] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total, count) for key, (counts, total, count) in self._values.items()}
+        for key, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket", _format_labels(self.labelnames, key, ('le', _format_value(float(bound)))), cumulative
+            yield f"{self.name}_bucket", _format_labels(self.labelnames, key, ('le', '+Inf')), count
+            yield f"{self.name}_sum", _format_labels(self.labelnames, key), total
+            yield f"{self.name}_count", _format_labels(self.labelnames, key), count
+
+
+class Registry:
+    """
+    Все метрики процесса. Кроме метрик, которые обновляются по ходу работы, можно добавить
+    сборщики: функции, которые в момент запроса /metrics возвращают готовые метрики
+    (так отдаются, например, текущий темп регулятора и число задач по статусам).
+    """
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self):
+        """Текстовый формат Prometheus (version 0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics)
+            collectors = list(self._collectors)
+        for collector in collectors:
+            try:
+                metrics.extend(collector())
+            except Exception as e:
+                logger.exception("Ошибка сборщика метрик %s: %s", collector.__name__, e)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def counter(name, documentation, labelnames=()):
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name, documentation, labelnames=()):
+    return REGISTRY.register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+def snapshot_gauge(name, documentation, labelnames, values):
+    """Gauge для сборщика: values — пары (словарь меток, значение)."""
+    metric = Gauge(name, documentation, labelnames)
+    for labels, value in values:
+        metric.set(value, **labels)
+    return metric
+
+
+def snapshot_counter(name, documentation, labelnames, values):
+    """Counter для сборщика: значение уже посчитано в другом месте (например, в http_client)."""
+    metric = Counter(name, documentation, labelnames)
+    for labels, value in values:
+        metric.inc(value, **labels)
+    return metric
+
+
+# --- Метрики парсера ---
+
+STAGE_SECONDS = histogram(
+    'parser_stage_seconds',
+    'Длительность этапов парсинга: route_map, total, catalog_page, mapping, excel_write, excel_close',
+    ('stage',),
+)
+CARD_FETCH_SECONDS = histogram(
+    'parser_card_fetch_seconds',
+    'Загрузка card.json с одной корзины, включая повторы',
+    ('host',),
+)
+UPSTREAM_RESPONSES = counter(
+    'parser_upstream_responses_total',
+    'Ответы WB по группам хостов и статусам (error — сетевая ошибка или таймаут)',
+    ('group', 'status'),
+)
+UPSTREAM_RETRIES = counter(
+    'parser_upstream_retries_total',
+    'Повторы запросов к WB по причине: throttled (429/503) или error',
+    ('group', 'reason'),
+)
+UPSTREAM_EXHAUSTED = counter(
+    'parser_upstream_exhausted_total',
+    'Запросы, для которых кончились попытки',
+    ('group',),
+)
+CARD_RESULTS = counter(
+    'parser_cards_total',
+    'Итог загрузки карточек: ok, not_modified, not_found, error',
+    ('result',),
+)
+BASKET_PROBES = counter(
+    'parser_basket_probes_total',
+    'Перебор корзин для товаров вне карты маршрутов: miss — 404 на очередной корзине, hit — карточка найдена',
+    ('result',),
+)
+PRODUCTS = counter(
+    'parser_products_total',
+    'Обработанные товары (строки таблицы и товары без карточки)',
+    ('mode',),
+)
+CARDS_IN_FLIGHT = gauge(
+    'parser_cards_in_flight',
+    'Товары в окне параллельной загрузки карточек (по всем парсингам)',
+)
+ACTIVE_STREAMS = gauge(
+    'parser_active_streams',
+    'Открытые SSE-потоки событий задач',
+)
@@ -0,0 +1,418 @@
+"""
+Парсинг каталога продавца WB в Excel без веб-слоя: его используют и Flask-приложение (app.py),
+и пакетный запуск из командной строки (main.py), и бенчмарки.
+"""
+import re
+from urllib.parse import urlparse, parse_qs
+import requests
+import math
+import os
+import logging
+import time
+import uuid
+from card_fetcher import fetch_cards, prefetch
+from http_client import format_connection_stats
+from json_backend import dumps, loads, response_json, DecodeError
+from rate_control import controlled_get, get_rate_control, fixed_rate_control, format_rate_stats
+from route_map import RouteMap, RouteMapCache
+from basket_resolver import BasketResolver
+from card_cache import CardCache
+from snapshots import Snapshot, snapshot_key
+from checkpoints import Checkpoint
+from batch import BatchTarget, SharedProducts, unique_targets
+from excel_writer import ExcelStreamWriter
+from mapping import map_card, mapping_for_subject, DEFAULT_MAPPING
+from templates import header_for_subject
+from progress import ProgressReporter
+from tracing import Trace, section
+from metrics import PRODUCTS
+
+logger = logging.getLogger(__name__)
+
+# Заголовки, маскирующиеся под реальный браузер
+headers = {
+    'Accept': '*/*',
+    'Accept-Language': 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7',
+    'Connection': 'keep-alive',
+    'Origin': 'https://www.wildberries.ru',
+    'Referer': 'https://www.wildberries.ru/',
+    'Sec-Ch-Ua': '"Not A(Brand";v="99", "Google Chrome";v="121", "Chromium";v="121"',
+    'Sec-Ch-Ua-Mobile': '?0',
+    'Sec-Ch-Ua-Platform': '"Windows"',
+    'Sec-Fetch-Dest': 'empty',
+    'Sec-Fetch-Mode': 'cors',
+    'Sec-Fetch-Site': 'cross-site',
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
+}
+
+def make_request(url, headers, timeout=10, retries=5, rate_control=None):
+    """
+    Надежная функция для выполнения HTTP-запросов с повторными попытками.
+    Повторы после 429 и сетевых ошибок и паузы между ними задает общий регулятор темпа.
+    """
+    response = controlled_get(url, headers=headers, timeout=timeout, retries=retries, control=rate_control)
+    response.raise_for_status()  # Вызовет исключение для кодов 4xx/5xx
+    return response
+
+
+# --- НОВАЯ ФУНКЦИЯ-ГЕНЕРАТОР ДЛЯ СТРИМИНГА ПРОГРЕССA ---
+def stream_parser(seller_id, brand_id, xsubject_id=None, workers=None, requests_per_second=None, incremental=False, resume=True, trace=False, profile=False):
+    """
+    Основная логика парсинга, перестроенная в генератор, который yield'ит обновления прогресса.
+    workers задает параллелизм загрузки карточек. Темп запросов подстраивается под upstream
+    общим для процесса регулятором; requests_per_second фиксирует темп для этого запуска.
+    В режиме incremental карточки запрашиваются только для новых и изменившихся товаров,
+    остальные берутся из снимка прошлого запуска.
+    По ходу парсинга пишется контрольная точка; если прошлый запуск с теми же параметрами
+    прервался, готовые страницы и карточки берутся из нее (resume=False начинает заново).
+    trace записывает трассировку запуска рядом с итоговым файлом, profile — еще и профиль cProfile.
+    """
+    if trace or profile:
+        events = stream_parser(seller_id, brand_id, xsubject_id, workers, requests_per_second, incremental, resume)
+        yield from traced_run(events, Trace(profile=profile), snapshot_key(seller_id, brand_id, xsubject_id))
+        return
+    rate_control = fixed_rate_control(requests_per_second) if requests_per_second else get_rate_control()
+    # 1. Получение карты маршрутов для корзин
+    baskets = yield from load_route_map()
+
+    # 2. Определение общего количества товаров
+    products_total = fetch_products_total(seller_id, brand_id, xsubject_id, rate_control)
+    if not products_total:
+        raise Exception("Товары не найдены. Проверьте правильность ID продавца и бренда.")
+
+    pages_count = math.ceil(products_total / 100)
+    yield dumps({'type': 'start', 'total': products_total, 'message': f'Найдено товаров: {products_total}. Начинаем обработку...'})
+
+    # 3. Страницы каталога читаются в фоне, пока загружаются карточки уже полученных товаров.
+    # Каждый товар сразу превращается в строку Excel, после чего сырая карточка освобождается.
+    checkpoint = Checkpoint(seller_id, brand_id, xsubject_id)
+    snapshot = Snapshot(seller_id, brand_id, xsubject_id, load_previous=incremental)
+    mapping, writer = create_writer(xsubject_id)
+    progress = ProgressReporter(products_total)
+    try:
+        # Контрольную точку каталога ведет только один парсинг: тот же каталог с другими флагами идет без нее
+        if not checkpoint.claim():
+            yield dumps({'type': 'log', 'message': 'Этот каталог уже парсит другая задача: контрольная точка не ведется'})
+        elif resume:
+            resumed = checkpoint.load(products_total)
+            if resumed:
+                yield dumps({'type': 'log', 'message': f'Продолжаем прерванный парсинг: готово страниц {len(checkpoint.pages_done)}, карточек {resumed}'})
+        else:
+            checkpoint.start(products_total)
+        pages = iter_catalog_pages(seller_id, brand_id, xsubject_id, pages_count, rate_control, skip=checkpoint.pages_done)
+        products = prefetch(checkpoint.products(pages))
+        if incremental:
+            products = snapshot.apply(products)
+        for item in fetch_cards(products, baskets, headers, get_host_by_range, workers=workers, rate_control=rate_control, resolver=basket_resolver, cache=card_cache):
+            checkpoint.record(item)
+            snapshot.record(item)
+            with section('mapping'):
+                row = mapping.row(item)
+            PRODUCTS.inc(mode='incremental' if incremental else 'full')
+            if row is not None:
+                writer.append_values(row)
+            # Прогресс уходит сводными событиями, а не строкой на каждый товар
+            event = progress.add(item.get('name', ''))
+            if event is not None:
+                yield dumps(event)
+        event = progress.flush()
+        if event is not None:
+            yield dumps(event)
+        snapshot.save()
+        basket_resolver.save()
+        if incremental:
+            summary = snapshot.summary()
+            yield dumps({'type': 'diff', **summary, 'message': f"Новых: {summary['added']}, изменено: {summary['changed']}, без изменений: {summary['unchanged']}, удалено: {summary['removed']}"})
+        yield dumps({'type': 'log', 'message': format_connection_stats()})
+        yield dumps({'type': 'log', 'message': format_rate_stats(rate_control)})
+
+        # 4. Сохранение файла
+        yield dumps({'type': 'log', 'message': 'Создание Excel-файла...'})
+        output_path = writer.close()
+        if not output_path:
+            raise Exception("Не удалось создать Excel-файл.")
+        checkpoint.clear()
+    finally:
+        writer.discard()
+        snapshot.discard()
+        checkpoint.close()
+        checkpoint.release()
+
+    # 5. Отправка финального результата: только ссылка на файл, строки уже в нем
+    yield dumps({
+        'type': 'result',
+        'total': writer.rows_written,
+        'download_filename': os.path.basename(output_path),
+    })
+
+
+def batch_parser(targets, combined=False, workers=None, requests_per_second=None):
+    """
+    Пакетный парсинг нескольких целей (продавец/бренд/предмет) за один проход, с теми же событиями,
+    что у stream_parser. Каталоги целей читаются друг за другом в фоне, а карточки всех целей
+    загружаются одним пулом под общим регулятором темпа, так что пул не простаивает на границах целей.
+    Товары, общие для нескольких целей, запрашиваются один раз.
+    Результат — файл на каждую цель или один общий файл (combined).
+    """
+    targets = unique_targets([target if isinstance(target, BatchTarget) else BatchTarget(**target) for target in targets])
+    if not targets:
+        raise Exception("Не указано ни одной цели для парсинга.")
+    rate_control = fixed_rate_control(requests_per_second) if requests_per_second else get_rate_control()
+    baskets = yield from load_route_map()
+
+    for target in targets:
+        try:
+            target.total = fetch_products_total(target.seller_id, target.brand_id, target.xsubject_id, rate_control)
+        except Exception as e:
+            yield dumps({'type': 'log', 'message': f'{target.label}: {e}'})
+            continue
+        yield dumps({'type': 'log', 'message': f'{target.label}: найдено товаров {target.total}'})
+    active = [(index, target) for index, target in enumerate(targets) if target.total]
+    if not active:
+        raise Exception("Товары не найдены ни для одной цели. Проверьте правильность ID продавцов и брендов.")
+    products_total = sum(target.total for _, target in active)
+    yield dumps({'type': 'start', 'total': products_total, 'message': f'Целей: {len(active)}, товаров: {products_total}. Начинаем обработку...'})
+
+    def listings():
+        for index, target in active:
+            pages_count = math.ceil(target.total / 100)
+            for item in iter_catalog_products(target.seller_id, target.brand_id, target.xsubject_id, pages_count, rate_control):
+                yield index, item
+
+    shared = SharedProducts(card_cache, combined=combined)
+    products = prefetch(shared.products(listings()))
+    outputs = {}
+    try:
+        if combined:
+            # Общий файл получает шапку предмета, только если он у всех целей один
+            subjects = {target.xsubject_id for _, target in active}
+            outputs[None] = create_writer(subjects.pop() if len(subjects) == 1 else None, suffix='_batch')
+        else:
+            for index, target in active:
+                outputs[index] = create_writer(target.xsubject_id, suffix=f'_{target.label}')
+
+        progress = ProgressReporter(products_total)
+        for item in fetch_cards(products, baskets, headers, get_host_by_range, workers=workers, rate_control=rate_control, resolver=basket_resolver, cache=card_cache):
+            owners = shared.finish(item)
+            rows = {} # одна строка на набор колонок, даже если он у нескольких целей
+            for owner in ([None] if combined else owners):
+                mapping, writer = outputs[owner]
+                if id(mapping) not in rows:
+                    with section('mapping'):
+                        rows[id(mapping)] = mapping.row(item)
+                if rows[id(mapping)] is not None:
+                    writer.append_values(rows[id(mapping)])
+            PRODUCTS.inc(mode='batch')
+            event = progress.add(item.get('name', ''), max(len(owners), 1))
+            if event is not None:
+                yield dumps(event)
+        event = progress.flush()
+        if event is not None:
+            yield dumps(event)
+        basket_resolver.save()
+        yield dumps({'type': 'log', 'message': f'Товаров, общих для нескольких целей: {shared.duplicates}'})
+        yield dumps({'type': 'log', 'message': format_connection_stats()})
+        yield dumps({'type': 'log', 'message': format_rate_stats(rate_control)})
+
+        yield dumps({'type': 'log', 'message': 'Создание Excel-файлов...'})
+        files = []
+        for owner, (_, writer) in outputs.items():
+            output_path = writer.close()
+            if output_path:
+                target = targets[owner].as_dict() if owner is not None else None
+                files.append({'target': target, 'total': writer.rows_written, 'download_filename': os.path.basename(output_path)})
+        if not files:
+            raise Exception("Не удалось создать Excel-файл.")
+    finally:
+        # Файлы, которые не дошли до close(), бросаются вместе с временными файлами openpyxl
+        for _, writer in outputs.values():
+            writer.discard()
+
+    yield dumps({
+        'type': 'result',
+        'total': sum(f['total'] for f in files),
+        'download_filename': files[0]['download_filename'],
+        'files': files,
+    })
+
+
+def traced_run(events, run_trace, name):
+    """
+    Пропускает события парсинга, выполняя его под трассировкой. Трассировка сохраняется
+    рядом с итоговым файлом (downloads/<файл>.trace.json и .prof), а если итога нет —
+    в downloads/trace_<name>_<время>_<случайная часть>; имена файлов попадают в событие result.
+    """
+    result = None
+    try:
+        with run_trace.activate():
+            for raw in events:
+                event = loads(raw)
+                if event.get('type') == 'result':
+                    result = event
+                    continue
+                yield raw
+    finally:
+        if result is not None:
+            base_path = os.path.splitext(os.path.join('downloads', result['download_filename']))[0]
+        else:
+            base_path = os.path.join('downloads', f"trace_{name}_{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}")
+        try:
+            files = run_trace.save(base_path)
+        except OSError as e:
+            files = []
+            logger.exception("Не удалось сохранить трассировку %s: %s", base_path, e)
+    yield dumps({'type': 'log', 'message': run_trace.describe()})
+    if result is not None:
+        result['trace_files'] = [os.path.basename(path) for path in files]
+        yield dumps(result)
+
+
+def load_route_map():
+    """Карта маршрутов корзин; попутно отдает события лога. Использование: baskets = yield from load_route_map()."""
+    yield dumps({'type': 'log', 'message': 'Получение карты маршрутов WB...'})
+    baskets = get_mediabasket_route_map()
+    if not baskets:
+        yield dumps({'type': 'log', 'message': 'Не удалось получить карту маршрутов. Парсинг может быть неполным.'})
+    for problem in baskets.problems:
+        yield dumps({'type': 'log', 'message': f'Карта маршрутов: {problem}'})
+    return baskets
+
+
+def fetch_products_total(seller_id, brand_id, xsubject_id=None, rate_control=None):
+    """Общее число товаров продавца/бренда (и предмета) по данным фильтров каталога."""
+    url_total_list = f"https://catalog.wb.ru/sellers/v8/filters?ab_testing=false&appType=1&curr=rub&dest=12358357&fbrand={brand_id}&lang=ru&spp=30&supplier={seller_id}&uclusters=0"
+    if xsubject_id:
+        url_total_list += f"&xsubject={xsubject_id}"
+
+    try:
+        with section('total'):
+            response_total = make_request(url_total_list, headers=headers, rate_control=rate_control)
+        res_total = response_json(response_total)
+        return res_total.get('data', {}).get('total', 0)
+    except (requests.exceptions.RequestException, DecodeError, Exception) as e:
+        raise Exception(f"Критическая ошибка при получении общего числа товаров: {e}")
+
+
+def create_writer(xsubject_id=None, suffix=''):
+    """Набор колонок и потоковый Excel-писатель под предмет (без предмета — исходная шапка)."""
+    mapping = mapping_for_subject(xsubject_id)
+    if mapping is DEFAULT_MAPPING:
+        return mapping, ExcelStreamWriter(suffix=suffix)
+    # Шапка из шаблона категории WB; если шаблона нет — простая шапка по колонкам предмета
+    return mapping, ExcelStreamWriter(columns=mapping.columns, header=header_for_subject(xsubject_id, mapping.columns), suffix=suffix)
+
+
+def iter_catalog_products(seller_id, brand_id, xsubject_id, pages_count, rate_control=None):
+    """Постранично читает каталог продавца и отдает заготовки товаров по одной."""
+    for _, products_on_page in iter_catalog_pages(seller_id, brand_id, xsubject_id, pages_count, rate_control):
+        yield from products_on_page
+
+
+def iter_catalog_pages(seller_id, brand_id, xsubject_id, pages_count, rate_control=None, skip=()):
+    """
+    Постранично читает каталог продавца и отдает пары (номер страницы, товары).
+    Страницы из skip не запрашиваются (отдаются с пустым списком); страница, которую
+    не удалось получить, пропускается.
+    """
+    for current_page in range(1, pages_count + 1):
+        if current_page in skip:
+            yield current_page, []
+            continue
+        url_list = f"https://catalog.wb.ru/sellers/v4/catalog?ab_testing=false&appType=1&curr=rub&dest=12358357&fbrand={brand_id}&hide_dtype=13&lang=ru&page={current_page}&sort=popular&spp=30&supplier={seller_id}"
+        if xsubject_id:
+            url_list += f"&xsubject={xsubject_id}"
+
+        try:
+            # Паузы после ошибок уже выдержаны регулятором темпа внутри make_request
+            with section('catalog_page'):
+                response = make_request(url_list, headers=headers, rate_control=rate_control)
+                products_on_page = response_json(response).get('products', [])
+        except (requests.exceptions.RequestException, DecodeError):
+            continue
+
+        yield current_page, products_on_page
+
+
+def parse_target(text):
+    """
+    Цель пакетного парсинга из строки: ссылка на продавца, "seller brand [xsubject]"
+    или "seller:brand[:xsubject]" (удобно в командной строке).
+    """
+    text = text.strip()
+    if not text.startswith('http'):
+        text = text.replace(':', ' ')
+    return BatchTarget(*parse_input(text))
+
+
+# --- Вспомогательные функции (без критических изменений) ---
+def check_string(s): return bool(re.fullmatch(r'(\d+%3B)*\d+', s))
+def parse_input(input_str):
+    parts = input_str.split()
+    sellerId, brandId, xsubjectId = '', '', None
+
+    if len(parts) >= 2:
+        sellerId, brandId = parts[0], parts[1]
+        if not sellerId.isdigit() or not check_string(brandId):
+            raise ValueError("Необходимо указать число и ID бренда(ов)")
+        if len(parts) > 2 and parts[2].isdigit():
+            xsubjectId = parts[2]
+    else:
+        parseResult = urlparse(input_str)
+        sellerId = str(parseResult.path).split('/')[2]
+        query = parse_qs(parseResult.query)
+        
+        if 'fbrand' not in query:
+            raise ValueError("Параметр fbrand не найден в ссылке.")
+        brandId = query['fbrand'][0]
+
+        if 'xsubject' in query and query['xsubject'][0].isdigit():
+            xsubjectId = query['xsubject'][0]
+
+    return (sellerId, brandId, xsubjectId)
+
+def fetch_mediabasket_hosts():
+    """Запрашивает у upstreams список хостов корзин с диапазонами vol."""
+    with section('route_map'):
+        response = make_request('https://cdn.wbbasket.ru/api/v3/upstreams', headers=headers, timeout=5)
+        data = response_json(response)
+    if 'recommend' in data and 'mediabasket_route_map' in data['recommend']:
+        return data['recommend']['mediabasket_route_map'][0]['hosts']
+    return []
+
+route_map_cache = RouteMapCache(fetch_mediabasket_hosts)
+basket_resolver = BasketResolver()
+card_cache = CardCache()
+
+def get_mediabasket_route_map():
+    """Карта маршрутов корзин из общего кэша (пустая RouteMap, если ее не удалось получить ни разу)."""
+    return route_map_cache.get()
+
+def get_host_by_range(range_value, route_map):
+    if isinstance(route_map, RouteMap): return route_map.resolve(range_value)
+    if not isinstance(route_map, list): return ''
+    for host_info in route_map: 
+        if 'vol_range_from' in host_info and 'vol_range_to' in host_info and host_info['vol_range_from'] <= range_value <= host_info['vol_range_to']: 
+            return host_info['host']
+    return ''
+
+def map_data(data, baskets):
+    new_data = []
+    for item in data:
+        new_item = map_item(item)
+        if new_item is not None:
+            new_data.append(new_item)
+    return new_data
+
+def map_item(item):
+    """Преобразует один товар с карточкой в строку таблицы (None, если карточки нет)."""
+    return map_card(item)
+
+def create_excel_file(data):
+    """Записывает строки (список или любой итератор словарей) в Excel потоково."""
+    writer = ExcelStreamWriter()
+    try:
+        for row_data in data or []:
+            writer.append(row_data)
+        return writer.close()
+    finally:
+        writer.discard()
@@ -0,0 +1,109 @@
+import os
+import time
+from collections import deque
+from json_backend import loads, dumps
+
+# Событие прогресса отправляется не чаще раза в PROGRESS_INTERVAL сек или раз в PROGRESS_BATCH товаров
+PROGRESS_INTERVAL = float(os.environ.get('PARSER_PROGRESS_INTERVAL', 0.5))
+PROGRESS_BATCH = int(os.environ.get('PARSER_PROGRESS_BATCH', 500))
+# Сколько последних названий товаров несет одно событие
+PROGRESS_NAMES = int(os.environ.get('PARSER_PROGRESS_NAMES', 5))
+# Вес нового замера в скользящей скорости (0..1): чем больше, тем быстрее ETA реагирует на смену темпа
+RATE_SMOOTHING = 0.3
+# Границы частоты событий прогресса, которую может запросить клиент (сек)
+CLIENT_INTERVAL_MAX = 30
+
+
+class ProgressReporter:
+    """
+    Сводит прогресс по отдельным товарам в редкие события: счетчик, скорость (товаров/с,
+    скользящее среднее), оценка оставшегося времени и несколько последних названий.
+    add() возвращает событие, когда набралось PROGRESS_BATCH товаров или прошло PROGRESS_INTERVAL,
+    иначе None; flush() отдает накопленный остаток в конце.
+    """
+    def __init__(self, total, interval=None, batch=None, names=None):
+        self.total = total
+        self.interval = PROGRESS_INTERVAL if interval is None else interval
+        self.batch = batch or PROGRESS_BATCH
+        self.current = 0
+        self.rate = None
+        self._names = deque(maxlen=names or PROGRESS_NAMES)
+        self._pending = 0
+        self._sent_at = time.monotonic()
+
+    def add(self, name='', count=1):
+        self.current += count
+        self._pending += count
+        if name:
+            self._names.append(name)
+        now = time.monotonic()
+        if self._pending >= self.batch or now - self._sent_at >= self.interval:
+            return self._event(now)
+        return None
+
+    def flush(self):
+        if not self._pending:
+            return None
+        return self._event(time.monotonic())
+
+    def _event(self, now):
+        elapsed = now - self._sent_at
+        if elapsed > 0:
+            recent = self._pending / elapsed
+            self.rate = recent if self.rate is None else RATE_SMOOTHING * recent + (1 - RATE_SMOOTHING) * self.rate
+        current = min(self.current, self.total)
+        names = list(self._names)
+        event = {
+            'type': 'progress',
+            'current': current,
+            'total': self.total,
+            'rate': round(self.rate, 1) if self.rate else 0,
+            'eta': round((self.total - current) / self.rate) if self.rate else None,
+            'names': names,
+            'message': names[-1] if names else '',
+        }
+        self._names.clear()
+        self._pending = 0
+        self._sent_at = now
+        return event
+
+
+def client_interval(value):
+    """Частота событий прогресса, запрошенная клиентом (сек); None — как отдает задача."""
+    try:
+        interval = float(value)
+    except (TypeError, ValueError):
+        return None
+    if interval <= 0:
+        return None
+    return min(interval, CLIENT_INTERVAL_MAX)
+
+
+def coalesce_progress(events, interval):
+    """
+    Прореживает поток событий задачи (пары (seq, JSON-строка) и None-keepalive) для одного клиента:
+    событие прогресса уходит не чаще раза в interval сек. Пропущенные события ничего не теряют —
+    счетчик в каждом накопительный, а их названия переходят в следующее отправленное.
+    Отложенный прогресс отправляется перед любым другим событием.
+    """
+    pending = None # (seq, событие)
+    names = deque(maxlen=PROGRESS_NAMES)
+    sent_at = 0.0
+    for entry in events:
+        event = loads(entry[1]) if entry is not None else None
+        if event is not None and event.get('type') == 'progress':
+            names.extend(event.get('names') or [])
+            pending = (entry[0], event)
+            if time.monotonic() - sent_at < interval:
+                continue
+        elif pending is None or (event is None and time.monotonic() - sent_at < interval):
+            yield entry
+            continue
+        seq, progress = pending
+        progress['names'] = list(names)
+        names.clear()
+        sent_at = time.monotonic()
+        yield seq, dumps(progress)
+        pending = None
+        if event is not None and event.get('type') != 'progress':
+            yield entry
@@ -0,0 +1,206 @@
+import os
+import re
+import time
+import threading
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+import requests
+from http_client import get_session
+from metrics import UPSTREAM_RESPONSES, UPSTREAM_RETRIES, UPSTREAM_EXHAUSTED
+import tracing
+
+# Начальный, минимальный и максимальный темп запросов к одной группе хостов (запросов в секунду)
+REQUESTS_PER_SECOND = float(os.environ.get('PARSER_REQUESTS_PER_SECOND', 10))
+RATE_MIN = float(os.environ.get('PARSER_RATE_MIN', 1))
+RATE_MAX = float(os.environ.get('PARSER_RATE_MAX', 50))
+# На сколько запросов в секунду темп растет за секунду без ошибок
+RATE_STEP = float(os.environ.get('PARSER_RATE_STEP', 2))
+# Во сколько раз темп падает после 429 или таймаута
+RATE_BACKOFF = float(os.environ.get('PARSER_RATE_BACKOFF', 0.5))
+# Самая длинная пауза группы после серии ошибок (сек)
+RATE_MAX_PAUSE = float(os.environ.get('PARSER_RATE_MAX_PAUSE', 60))
+
+# Статусы, которыми upstream просит сбавить темп
+THROTTLE_STATUSES = (429, 503)
+# Статусы, которые поднимают темп: upstream справился с запросом. Остальные ответы (например, 404
+# при переборе корзин) о пропускной способности ничего не говорят и темп не меняют
+SUCCESS_STATUSES = frozenset(range(200, 300)) | {304}
+
+_BASKET_RE = re.compile(r'^basket-\d+\.wbbasket\.ru$')
+
+
+def host_group(host):
+    """Группа хостов с общим лимитом: все корзины basket-NN считаются одним upstream."""
+    host = (host or '').lower()
+    if _BASKET_RE.match(host):
+        return 'basket'
+    return host
+
+
+def retry_after_seconds(response):
+    """Значение Retry-After в секундах (число или HTTP-дата); None, если заголовка нет."""
+    value = response.headers.get('Retry-After') if response is not None else None
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveLimiter:
+    """
+    Темп запросов к одной группе хостов по схеме AIMD, общий для всех потоков.
+    Каждый успешный ответ (2xx/304) понемногу поднимает темп (примерно на RATE_STEP за секунду),
+    429/503 и сетевые ошибки снижают его в RATE_BACKOFF раз — не чаще раза за интервал,
+    чтобы пачка параллельных отказов не обрушила темп до минимума. Retry-After, а без него
+    растущая с каждой ошибкой подряд пауза, приостанавливает всю группу.
+    """
+    def __init__(self, rate=None, min_rate=None, max_rate=None):
+        self.min_rate = min_rate or RATE_MIN
+        self.max_rate = max_rate or RATE_MAX
+        self.rate = min(max(rate or REQUESTS_PER_SECOND, self.min_rate), self.max_rate)
+        self._next_slot = 0.0
+        self._paused_until = 0.0
+        self._decreased_at = 0.0
+        self._error_streak = 0
+        self.requests = self.throttled_count = self.failures = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Резервирует следующий слот (с учетом паузы группы) и ждет его наступления."""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot, self._paused_until)
+            self._next_slot = slot + 1.0 / self.rate
+            self.requests += 1
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+    def success(self):
+        with self._lock:
+            self._error_streak = 0
+            self.rate = min(self.rate + RATE_STEP / self.rate, self.max_rate)
+
+    def answered(self):
+        """Ответ без сигнала о темпе (404 и т.п.): серия ошибок прервана, темп прежний."""
+        with self._lock:
+            self._error_streak = 0
+
+    def _back_off(self, pause):
+        now = time.monotonic()
+        self._error_streak += 1
+        if now - self._decreased_at >= 1.0 / self.rate:
+            self.rate = max(self.rate * RATE_BACKOFF, self.min_rate)
+            self._decreased_at = now
+        if pause is None:
+            pause = min(0.5 * 2 ** (self._error_streak - 1), RATE_MAX_PAUSE)
+        self._paused_until = max(self._paused_until, now + min(pause, RATE_MAX_PAUSE))
+
+    def throttled(self, retry_after=None):
+        """Upstream ответил 429/503: снижаем темп и ждем Retry-After (или растущую паузу)."""
+        with self._lock:
+            self.throttled_count += 1
+            self._back_off(retry_after)
+
+    def failure(self):
+        """Таймаут или обрыв соединения."""
+        with self._lock:
+            self.failures += 1
+            self._back_off(None)
+
+
+class RateControl:
+    """Набор AdaptiveLimiter по группам хостов. Один на процесс, чтобы параллельные парсинги делили лимит."""
+    def __init__(self, rate=None, min_rate=None, max_rate=None):
+        self._settings = (rate, min_rate, max_rate)
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def for_host(self, host):
+        group = host_group(host)
+        limiter = self._limiters.get(group)
+        if limiter is None:
+            with self._lock:
+                limiter = self._limiters.setdefault(group, AdaptiveLimiter(*self._settings))
+        return limiter
+
+    def for_url(self, url):
+        return self.for_host(urlparse(url).hostname)
+
+    def stats(self):
+        with self._lock:
+            limiters = dict(self._limiters)
+        return {
+            group: {'rate': round(limiter.rate, 2), 'requests': limiter.requests, 'throttled': limiter.throttled_count, 'failures': limiter.failures}
+            for group, limiter in limiters.items()
+        }
+
+
+def fixed_rate_control(requests_per_second):
+    """RateControl с постоянным темпом (без адаптации) — для явно заданного бюджета запуска."""
+    return RateControl(requests_per_second, requests_per_second, requests_per_second)
+
+
+_rate_control = RateControl()
+
+
+def get_rate_control():
+    return _rate_control
+
+
+def format_rate_stats(control=None):
+    stats = (control or _rate_control).stats()
+    parts = [f"{group} {s['rate']} rps (429: {s['throttled']}, ошибок: {s['failures']})" for group, s in sorted(stats.items())]
+    return "Темп запросов: " + ", ".join(parts) if parts else "Темп запросов: запросов не было"
+
+
+class RetriesExhausted(requests.exceptions.RequestException):
+    pass
+
+
+def controlled_get(url, headers=None, timeout=10, retries=5, control=None):
+    """
+    GET через регулятор темпа группы хоста. 429/503 и сетевые ошибки повторяются
+    (паузы задает регулятор), любой другой ответ возвращается как есть.
+    Если попытки кончились, поднимается RetriesExhausted.
+    """
+    group = host_group(urlparse(url).hostname)
+    limiter = (control or _rate_control).for_host(group)
+    last_error = None
+    for attempt in range(retries):
+        if attempt:
+            UPSTREAM_RETRIES.inc(group=group, reason='throttled' if isinstance(last_error, requests.exceptions.HTTPError) else 'error')
+        trace = tracing.current()
+        started = time.perf_counter()
+        limiter.acquire()
+        if trace is not None:
+            trace.sleep(group, started)
+            started = time.perf_counter()
+        try:
+            response = get_session().get(url, headers=headers, timeout=timeout)
+        except requests.exceptions.RequestException as e:
+            UPSTREAM_RESPONSES.inc(group=group, status='error')
+            if trace is not None:
+                trace.http(url, started, attempt, error=e)
+            limiter.failure()
+            last_error = e
+            continue
+        UPSTREAM_RESPONSES.inc(group=group, status=response.status_code)
+        if trace is not None:
+            trace.http(url, started, attempt, response)
+        if response.status_code in THROTTLE_STATUSES:
+            limiter.throttled(retry_after_seconds(response))
+            last_error = requests.exceptions.HTTPError(f"HTTP {response.status_code}", response=response)
+            continue
+        if response.status_code in SUCCESS_STATUSES:
+            limiter.success()
+        else:
+            limiter.answered()
+        return response
+    UPSTREAM_EXHAUSTED.inc(group=group)
+    raise RetriesExhausted(f"Не удалось получить данные после {retries} попыток. URL: {url} ({last_error})")
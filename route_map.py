@@ -0,0 +1,130 @@
+import os
+import time
+import threading
+from bisect import bisect_right
+from storage import data_path, read_json, write_json_atomic
+
+# Сколько секунд карта маршрутов считается свежей
+ROUTE_MAP_TTL = float(os.environ.get('PARSER_ROUTE_MAP_TTL', 3600))
+
+
+class RouteMap:
+    """
+    Карта маршрутов mediabasket, скомпилированная в отсортированный список интервалов.
+    Поиск хоста по vol выполняется бинарным поиском вместо перебора всего списка.
+    При сборке интервалы проверяются на пересечения и разрывы; найденное попадает в problems.
+    """
+    def __init__(self, hosts=None):
+        self.problems = []
+        ranges = []
+        for host_info in hosts or []:
+            if not isinstance(host_info, dict):
+                continue
+            if 'vol_range_from' not in host_info or 'vol_range_to' not in host_info or not host_info.get('host'):
+                self.problems.append(f"Пропущена запись без диапазона или хоста: {host_info}")
+                continue
+            ranges.append((int(host_info['vol_range_from']), int(host_info['vol_range_to']), host_info['host']))
+        ranges.sort()
+
+        self._starts, self._ends, self._hosts = [], [], []
+        for start, end, host in ranges:
+            if start > end:
+                self.problems.append(f"Пустой диапазон {start}-{end} у {host}")
+                continue
+            if self._ends:
+                prev_end = self._ends[-1]
+                if start <= prev_end:
+                    self.problems.append(f"Пересечение диапазонов: {host} начинается с {start}, предыдущий заканчивается на {prev_end}")
+                    if end <= prev_end:
+                        continue
+                    start = prev_end + 1 # Пересекающуюся часть оставляем за предыдущим хостом
+                elif start > prev_end + 1:
+                    self.problems.append(f"Разрыв в карте маршрутов: vol {prev_end + 1}-{start - 1} не обслуживается")
+            self._starts.append(start)
+            self._ends.append(end)
+            self._hosts.append(host)
+
+    def __len__(self):
+        return len(self._hosts)
+
+    def resolve(self, vol):
+        """Возвращает хост корзины для vol или пустую строку, если vol не покрыт картой."""
+        idx = bisect_right(self._starts, vol) - 1
+        if idx >= 0 and vol <= self._ends[idx]:
+            return self._hosts[idx]
+        return ''
+
+    def hosts(self):
+        return list(zip(self._starts, self._ends, self._hosts))
+
+
+class RouteMapCache:
+    """
+    Общий для процесса кэш карты маршрутов с копией на диске.
+    Свежая карта отдается из памяти; устаревшая отдается сразу, а обновление идет в фоне.
+    Синхронная загрузка выполняется только если карты нет ни в памяти, ни на диске.
+    Ошибка обновления не затирает уже известную карту.
+    """
+    def __init__(self, loader, path=None, ttl=None):
+        self.loader = loader # Функция, возвращающая список хостов из upstreams
+        self.path = path or data_path('route_map.json')
+        self.ttl = ROUTE_MAP_TTL if ttl is None else ttl
+        self._route_map = None
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+        self._initial_load_lock = threading.Lock()
+        self._refreshing = False
+
+    def get(self):
+        with self._lock:
+            if self._route_map is None:
+                self._load_from_disk()
+            route_map = self._route_map
+            is_stale = time.time() - self._fetched_at > self.ttl
+            if route_map is not None and is_stale and not self._refreshing:
+                self._refreshing = True
+                threading.Thread(target=self._background_refresh, daemon=True).start()
+        if route_map is None:
+            # Карты нет совсем: загружаем синхронно (один запрос на все ждущие потоки),
+            # при неудаче остается перебор корзин
+            with self._initial_load_lock:
+                if self._route_map is None:
+                    self.refresh()
+                route_map = self._route_map
+        return route_map or RouteMap()
+
+    def refresh(self):
+        """Загружает карту через loader; ошибка или пустой ответ оставляют прежнюю карту."""
+        try:
+            hosts = self.loader()
+        except Exception:
+            return False
+        route_map = RouteMap(hosts)
+        if not route_map:
+            return False
+        fetched_at = time.time()
+        with self._lock:
+            self._route_map, self._fetched_at = route_map, fetched_at
+        try:
+            write_json_atomic(self.path, {'fetched_at': fetched_at, 'hosts': hosts})
+        except OSError:
+            pass # Кэш на диске необязателен, карта в памяти уже обновлена
+        return True
+
+    def _load_from_disk(self):
+        cached = read_json(self.path)
+        if cached and cached.get('hosts'):
+            route_map = RouteMap(cached['hosts'])
+            if route_map and cached.get('fetched_at', 0.0) >= self._fetched_at:
+                self._route_map, self._fetched_at = route_map, cached.get('fetched_at', 0.0)
+
+    def _background_refresh(self):
+        try:
+            # Другой воркер gunicorn мог уже обновить файл на диске
+            with self._lock:
+                self._load_from_disk()
+                is_stale = time.time() - self._fetched_at > self.ttl
+            if is_stale:
+                self.refresh()
+        finally:
+            self._refreshing = False
@@ -0,0 +1,115 @@
+import os
+import re
+import gzip
+import json
+import hashlib
+import tempfile
+from storage import data_path
+from json_backend import loads, dumps
+
+# Поля из выдачи каталога, изменение которых означает, что карточку нужно перечитать
+FINGERPRINT_FIELDS = (
+    'name', 'brand', 'brandId', 'subjectId', 'supplierId', 'priceU', 'salePriceU',
+    'rating', 'reviewRating', 'feedbacks', 'pics', 'colors',
+)
+
+
+def listing_fingerprint(item):
+    """Короткий хэш полей товара из выдачи каталога (цены, рейтинг, отзывы и т.п.)."""
+    fields = {key: item.get(key) for key in FINGERPRINT_FIELDS}
+    fields['sizes'] = [size.get('price') for size in item.get('sizes') or [] if isinstance(size, dict)]
+    payload = json.dumps(fields, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def snapshot_key(seller_id, brand_id, xsubject_id=None):
+    raw = f"{seller_id}_{brand_id}_{xsubject_id or 'all'}"
+    return re.sub(r'[^0-9A-Za-z_]+', '-', raw)
+
+
+class Snapshot:
+    """
+    Товары последнего запуска для комбинации seller/brand/xsubject: отпечаток выдачи
+    и сам товар с карточкой. По нему повторный запуск получает только новые и изменившиеся карточки.
+    Текущий запуск пишется на диск построчно (gzip, JSON lines), поэтому товары не копятся в памяти.
+    """
+    def __init__(self, seller_id, brand_id, xsubject_id=None, directory=None, load_previous=True):
+        self.path = os.path.join(directory or data_path('snapshots'), f"{snapshot_key(seller_id, brand_id, xsubject_id)}.jsonl.gz")
+        self.previous = self._load() if load_previous else {}
+        self._fingerprints = {}
+        self._file = self._tmp_path = None
+        self.recorded = 0
+        self.added = self.changed = self.unchanged = 0
+
+    def _load(self):
+        previous = {}
+        try:
+            with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    entry = loads(line)
+                    previous[entry['id']] = entry
+        except (OSError, ValueError, EOFError, KeyError):
+            return {}
+        return previous
+
+    def reuse(self, item):
+        """
+        Если товар не изменился с прошлого запуска, подставляет сохраненную карточку
+        в item['advanced'] и возвращает True. Заодно считает новые и измененные товары.
+        Использованные записи прошлого снимка освобождаются; оставшиеся в конце считаются удаленными.
+        """
+        product_id = str(item['id'])
+        fingerprint = self._fingerprints[product_id] = listing_fingerprint(item)
+        known = self.previous.pop(product_id, None)
+        if known is None:
+            self.added += 1
+            return False
+        if known['fingerprint'] != fingerprint or not known['item'].get('advanced'):
+            self.changed += 1
+            return False
+        self.unchanged += 1
+        item['advanced'] = known['item']['advanced']
+        return True
+
+    def apply(self, items):
+        """Пропускает поток товаров через reuse(), не меняя его порядок."""
+        for item in items:
+            self.reuse(item)
+            yield item
+
+    def record(self, item):
+        """Сразу дописывает товар в новый снимок."""
+        product_id = str(item['id'])
+        fingerprint = self._fingerprints.pop(product_id, None) or listing_fingerprint(item)
+        if self._file is None:
+            directory = os.path.dirname(self.path)
+            os.makedirs(directory, exist_ok=True)
+            fd, self._tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            self._file = gzip.open(os.fdopen(fd, 'wb'), 'wt', encoding='utf-8')
+        self._file.write(dumps({'id': product_id, 'fingerprint': fingerprint, 'item': item}))
+        self._file.write('\n')
+        self.recorded += 1
+
+    def removed(self):
+        return len(self.previous)
+
+    def summary(self):
+        return {'added': self.added, 'changed': self.changed, 'unchanged': self.unchanged, 'removed': self.removed()}
+
+    def save(self):
+        """Заменяет прошлый снимок текущим."""
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        os.replace(self._tmp_path, self.path)
+        self._tmp_path = None
+
+    def discard(self):
+        """Удаляет недописанный снимок (например, если парсинг прервался)."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._tmp_path and os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+        self._tmp_path = None
@@ -0,0 +1,34 @@
+import os
+import json
+import tempfile
+
+# Каталог для служебных данных парсера (кэши, снимки, состояние задач)
+DATA_DIR = os.environ.get('PARSER_DATA_DIR', 'data')
+
+
+def data_path(*parts):
+    """Путь внутри DATA_DIR; каталоги создаются при первой записи."""
+    return os.path.join(DATA_DIR, *parts)
+
+
+def read_json(path, default=None):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def write_json_atomic(path, data):
+    """Пишет JSON через временный файл и rename, чтобы параллельные процессы не читали половину файла."""
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -0,0 +1,228 @@
+import os
+import logging
+import zipfile
+import threading
+import xml.etree.ElementTree as ET
+from openpyxl import load_workbook
+from openpyxl.utils import get_column_letter, range_boundaries
+from mapping import load_subject_columns, subject_category
+
+logger = logging.getLogger(__name__)
+
+# Шаблоны загрузки WB по категориям: shablon/<категория>.xlsx
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'shablon')
+TEMPLATE_SHEET = 'Товары'
+HEADER_ROWS = 4
+# Прогревать шаблоны в фоне при старте приложения
+PRELOAD_TEMPLATES = os.environ.get('PARSER_PRELOAD_TEMPLATES', '1') not in ('0', 'false', 'no')
+
+_NS = {'x': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+
+
+def _cell_style(cell):
+    """Стиль ячейки шаблона; для пустых ячеек без стиля — None."""
+    if not getattr(cell, 'has_style', False):
+        return None
+    return {
+        'font': cell.font,
+        'fill': cell.fill,
+        'alignment': cell.alignment,
+        'border': cell.border,
+    }
+
+
+def _sheet_layout(path, worksheet_path):
+    """
+    Объединения, ширины колонок, высоты строк шапки и закрепление из XML листа.
+    В read-only режиме openpyxl их не отдает, а полная загрузка шаблонов WB падает
+    на dataValidation, поэтому нужные части читаются напрямую.
+    """
+    with zipfile.ZipFile(path) as archive:
+        root = ET.fromstring(archive.read(worksheet_path))
+
+    merges = []
+    for merge in root.iterfind('x:mergeCells/x:mergeCell', _NS):
+        min_col, min_row, max_col, max_row = range_boundaries(merge.get('ref'))
+        if max_row <= HEADER_ROWS:
+            merges.append((min_col, min_row, max_col, max_row))
+
+    widths = {}
+    for col in root.iterfind('x:cols/x:col', _NS):
+        if col.get('width') is None:
+            continue
+        for idx in range(int(col.get('min')), min(int(col.get('max')), 16384) + 1):
+            widths[idx] = float(col.get('width'))
+    default_width = None
+    sheet_format = root.find('x:sheetFormatPr', _NS)
+    if sheet_format is not None and sheet_format.get('defaultColWidth'):
+        default_width = float(sheet_format.get('defaultColWidth'))
+
+    heights = {}
+    for row in root.iterfind('x:sheetData/x:row', _NS):
+        row_idx = int(row.get('r'))
+        if row_idx > HEADER_ROWS:
+            break
+        if row.get('ht'):
+            heights[row_idx] = float(row.get('ht'))
+
+    freeze = None
+    pane = root.find('x:sheetViews/x:sheetView/x:pane', _NS)
+    if pane is not None and pane.get('state') == 'frozen':
+        freeze = pane.get('topLeftCell')
+
+    return merges, widths, default_width, heights, freeze
+
+
+class CategoryTemplate:
+    """
+    Шапка шаблона категории, прочитанная один раз: для каждой колонки — заголовок,
+    описание, группа (объединенная ячейка строк 1-2), ширина и стили четырех строк шапки.
+    """
+    def __init__(self, path):
+        wb = load_workbook(path, read_only=True)
+        try:
+            ws = wb[TEMPLATE_SHEET] if TEMPLATE_SHEET in wb.sheetnames else wb.worksheets[0]
+            rows = [list(row) for row in ws.iter_rows(min_row=1, max_row=HEADER_ROWS)]
+            worksheet_path = ws._worksheet_path
+        finally:
+            wb.close()
+        while len(rows) < HEADER_ROWS:
+            rows.append([])
+        merges, widths, default_width, heights, freeze = _sheet_layout(path, worksheet_path)
+
+        # Лист размечен на тысячи колонок, шапка кончается на последнем заголовке
+        headers = rows[2]
+        last = max((idx for idx, cell in enumerate(headers) if cell.value not in (None, '')), default=-1)
+
+        groups = {} # колонка (с 1) -> первая колонка группы
+        for min_col, min_row, max_col, _ in merges:
+            if min_row != 1:
+                continue
+            for idx in range(min_col, max_col + 1):
+                groups[idx] = min_col
+
+        def cell_at(row, idx):
+            return rows[row][idx - 1] if idx - 1 < len(rows[row]) else None
+
+        self.columns = {}
+        for idx in range(1, last + 2):
+            name = headers[idx - 1].value
+            if name in (None, ''):
+                continue
+            group = groups.get(idx)
+            if group is None and cell_at(0, idx) is not None and cell_at(0, idx).value:
+                group = idx
+            styles = []
+            for row in range(HEADER_ROWS):
+                # В строках групп стиль задан в первой ячейке объединения
+                source = cell_at(row, group) if row < 2 and group else cell_at(row, idx)
+                styles.append(_cell_style(source) if source is not None else None)
+            description = cell_at(3, idx).value if cell_at(3, idx) is not None else None
+            self.columns.setdefault(str(name).strip(), {
+                'index': idx,
+                'group': group,
+                'group_title': cell_at(0, group).value if group else None,
+                'description': description or '',
+                'width': widths.get(idx, default_width),
+                'styles': styles,
+            })
+        self.heights = heights
+        self.freeze = freeze
+
+
+class TemplateHeader:
+    """
+    Готовая к записи шапка под набор колонок предмета: значения и стили строк 1-4,
+    объединения групп (соседние колонки одной группы шаблона), ширины и закрепление.
+    Колонки, которых нет в шаблоне, получают заголовок без описания и стиль соседней.
+    """
+    def __init__(self, template, columns):
+        self.columns = list(columns)
+        self.rows = [[] for _ in range(HEADER_ROWS)]
+        self.merges = []
+        self.widths = {}
+        self.heights = template.heights
+        self.freeze = template.freeze
+
+        previous_group, run_start = None, None
+        fallback = [None] * HEADER_ROWS
+        for position, column in enumerate(self.columns, start=1):
+            info = template.columns.get(column)
+            group = info['group'] if info else None
+            title = ''
+            if group is not None and group != previous_group:
+                title = info['group_title'] or ''
+            if group is None or group != previous_group:
+                self._close_group(run_start, position - 1)
+                run_start = position if group is not None else None
+            previous_group = group
+
+            styles = info['styles'] if info else fallback
+            fallback = [style or fallback[row] for row, style in enumerate(styles)]
+            values = (title, '', column, info['description'] if info else '')
+            for row in range(HEADER_ROWS):
+                self.rows[row].append((values[row], styles[row] or fallback[row]))
+            if info and info['width']:
+                self.widths[get_column_letter(position)] = info['width']
+        self._close_group(run_start, len(self.columns))
+
+    def _close_group(self, start, end):
+        if start is None or end <= start:
+            return
+        for row in (1, 2):
+            self.merges.append(f"{get_column_letter(start)}{row}:{get_column_letter(end)}{row}")
+
+
+_templates = {}
+_headers = {}
+_templates_lock = threading.Lock()
+
+
+def template_path(category):
+    return os.path.join(TEMPLATES_DIR, f"{category}.xlsx")
+
+
+def get_category_template(category):
+    """Разобранный шаблон категории (кэшируется на процесс); None, если файла нет или он не читается."""
+    if category in _templates:
+        return _templates[category]
+    with _templates_lock:
+        if category not in _templates:
+            path = template_path(category)
+            template = None
+            if os.path.exists(path):
+                try:
+                    template = CategoryTemplate(path)
+                except Exception as e:
+                    logger.exception("Не удалось прочитать шаблон %s: %s", path, e)
+            _templates[category] = template
+    return _templates[category]
+
+
+def header_for_subject(subject_id, columns):
+    """TemplateHeader под колонки предмета по шаблону его категории или None."""
+    if not subject_id:
+        return None
+    subject_id = str(subject_id)
+    if subject_id not in _headers:
+        category = subject_category(subject_id)
+        template = get_category_template(category) if category else None
+        _headers[subject_id] = TemplateHeader(template, columns) if template else None
+    return _headers[subject_id]
+
+
+def preload_templates():
+    """Разбирает шаблоны всех категорий из subcategories.json заранее, чтобы первый запуск не ждал."""
+    load_subject_columns()
+    categories = sorted({subject_category(subject_id) for subject_id in load_subject_columns()} - {None})
+    for category in categories:
+        get_category_template(category)
+    return sum(1 for category in categories if _templates.get(category) is not None)
+
+
+def start_preload():
+    if not PRELOAD_TEMPLATES:
+        return None
+    thread = threading.Thread(target=preload_templates, name='templates-preload', daemon=True)
+    thread.start()
+    return thread
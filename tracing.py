@@ -0,0 +1,213 @@
+import os
+import time
+import pstats
+import cProfile
+import threading
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+from urllib.parse import urlparse
+from json_backend import dumps_bytes
+from metrics import STAGE_SECONDS
+
+# Сколько событий хранит одна трассировка; дальше считаются только итоги
+TRACE_MAX_EVENTS = int(os.environ.get('PARSER_TRACE_MAX_EVENTS', 200000))
+# Ожидание регулятора темпа короче этого не попадает в шкалу событий (сек), но входит в итоги
+TRACE_MIN_SLEEP = 0.0005
+
+# Трассировка текущего парсинга; None — трассировка выключена (обычный случай)
+_current = ContextVar('parser_trace', default=None)
+
+
+def current():
+    return _current.get()
+
+
+class Trace:
+    """
+    Трассировка одного запуска парсинга: каждый HTTP-запрос (хост, статус, байты, попытка, время),
+    ожидание регулятора темпа и участки обработки (разметка, запись Excel) с временем CPU.
+    Сохраняется как шкала времени в формате Chrome Trace Event (открывается в Perfetto
+    или chrome://tracing) и, если включено профилирование, как дамп cProfile.
+    Потоки пула карточек и чтения каталога подключаются к трассировке через bind().
+    """
+    def __init__(self, profile=False, max_events=None):
+        self.max_events = TRACE_MAX_EVENTS if max_events is None else max_events
+        self.started = time.perf_counter()
+        self.started_at = time.time()
+        self.events = []
+        self.dropped = 0
+        self.totals = {'http_requests': 0, 'http_bytes': 0, 'http_seconds': 0.0, 'http_errors': 0, 'retries': 0, 'sleep_seconds': 0.0}
+        self.sections = {} # участок -> [вызовов, сек, сек CPU]
+        self._threads = {}
+        self._profilers = {} if profile else None
+        self._lock = threading.Lock()
+
+    def _add(self, name, category, started, duration, args):
+        thread = threading.current_thread()
+        event = {
+            'name': name, 'cat': category, 'ph': 'X', 'pid': 1, 'tid': thread.ident,
+            'ts': round((started - self.started) * 1e6, 1), 'dur': round(duration * 1e6, 1), 'args': args,
+        }
+        with self._lock:
+            self._threads.setdefault(thread.ident, thread.name)
+            if len(self.events) < self.max_events:
+                self.events.append(event)
+            else:
+                self.dropped += 1
+
+    def http(self, url, started, attempt, response=None, error=None):
+        """Одна попытка HTTP-запроса; response=None — сетевая ошибка или таймаут."""
+        duration = time.perf_counter() - started
+        parts = urlparse(url)
+        args = {'path': parts.path, 'attempt': attempt + 1}
+        if response is not None:
+            args['status'] = response.status_code
+            args['bytes'] = len(response.content)
+        else:
+            args['error'] = str(error)
+        with self._lock:
+            totals = self.totals
+            totals['http_requests'] += 1
+            totals['http_bytes'] += args.get('bytes', 0)
+            totals['http_seconds'] += duration
+            totals['retries'] += 1 if attempt else 0
+            totals['http_errors'] += 1 if response is None else 0
+        self._add(parts.hostname, 'http', started, duration, args)
+
+    def sleep(self, group, started):
+        """Ожидание регулятора темпа (в том числе паузы после 429)."""
+        duration = time.perf_counter() - started
+        with self._lock:
+            self.totals['sleep_seconds'] += duration
+        if duration >= TRACE_MIN_SLEEP:
+            self._add(f'sleep {group}', 'sleep', started, duration, {})
+
+    def section(self, name, started, duration, cpu, args):
+        with self._lock:
+            entry = self.sections.setdefault(name, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += duration
+            entry[2] += cpu
+        self._add(name, 'cpu', started, duration, dict(args, cpu_ms=round(cpu * 1000, 3)))
+
+    # --- потоки ---
+
+    def _profiler(self):
+        if self._profilers is None:
+            return None
+        ident = threading.get_ident()
+        with self._lock:
+            profiler = self._profilers.get(ident)
+            if profiler is None:
+                profiler = self._profilers[ident] = cProfile.Profile()
+        return profiler
+
+    def run(self, fn, *args, **kwargs):
+        """Выполняет fn в текущем потоке как часть трассировки (и под профилировщиком потока)."""
+        previous = _current.get()
+        _current.set(self)
+        profiler = self._profiler()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            _current.set(previous)
+
+    @contextmanager
+    def activate(self):
+        """Делает трассировку текущей для этого потока (поток задачи парсинга)."""
+        previous = _current.get()
+        _current.set(self)
+        profiler = self._profiler()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield self
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            _current.set(previous)
+
+    # --- итоги ---
+
+    def summary(self):
+        with self._lock:
+            totals = dict(self.totals)
+            sections = {name: {'calls': calls, 'seconds': round(seconds, 3), 'cpu_seconds': round(cpu, 3)}
+                        for name, (calls, seconds, cpu) in self.sections.items()}
+        totals['http_seconds'] = round(totals['http_seconds'], 3)
+        totals['sleep_seconds'] = round(totals['sleep_seconds'], 3)
+        return dict(totals, wall_seconds=round(time.perf_counter() - self.started, 3), sections=sections, dropped_events=self.dropped)
+
+    def describe(self):
+        summary = self.summary()
+        parts = [
+            f"HTTP {summary['http_requests']} запросов ({summary['http_bytes'] / 2**20:.1f} МБ, {summary['http_seconds']:.1f} с, повторов {summary['retries']})",
+            f"ожидание регулятора {summary['sleep_seconds']:.1f} с",
+        ]
+        parts.extend(f"{name} {section['seconds']:.2f} с (CPU {section['cpu_seconds']:.2f} с)" for name, section in sorted(summary['sections'].items()))
+        return "Трассировка: " + ", ".join(parts)
+
+    def save(self, base_path):
+        """
+        Пишет <base_path>.trace.json и, при профилировании, <base_path>.prof.
+        Возвращает список созданных файлов.
+        """
+        os.makedirs(os.path.dirname(base_path) or '.', exist_ok=True)
+        with self._lock:
+            events = list(self.events)
+            threads = dict(self._threads)
+        events.extend({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': ident, 'args': {'name': name}} for ident, name in threads.items())
+        trace_path = f"{base_path}.trace.json"
+        with open(trace_path, 'wb') as f:
+            f.write(dumps_bytes({
+                'traceEvents': events,
+                'displayTimeUnit': 'ms',
+                'otherData': dict(self.summary(), started_at=self.started_at),
+            }))
+        paths = [trace_path]
+        if self._profilers:
+            stats = None
+            for profiler in list(self._profilers.values()):
+                profiler.create_stats()
+                if not profiler.stats:
+                    continue
+                if stats is None:
+                    stats = pstats.Stats(profiler)
+                else:
+                    stats.add(profiler)
+            if stats is not None:
+                profile_path = f"{base_path}.prof"
+                stats.dump_stats(profile_path)
+                paths.append(profile_path)
+        return paths
+
+
+def bind(fn):
+    """
+    fn для выполнения в другом потоке в рамках текущей трассировки.
+    Без трассировки возвращает fn как есть, так что обычный парсинг ничего не платит.
+    """
+    trace = _current.get()
+    if trace is None:
+        return fn
+    return functools.partial(trace.run, fn)
+
+
+@contextmanager
+def section(name, **args):
+    """Участок обработки: длительность идет в parser_stage_seconds, а при трассировке — еще и в шкалу с временем CPU."""
+    trace = _current.get()
+    cpu = time.thread_time() if trace is not None else 0.0
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - started
+        STAGE_SECONDS.observe(duration, stage=name)
+        if trace is not None:
+            trace.section(name, started, duration, time.thread_time() - cpu, args)